@@ -1,53 +1,131 @@
-import json
+import argparse
 import os
 import sys
-from modules.extractor import extract_prescription
-from modules.translate import translate_summary
-from modules.voice import generate_voice_output
-from modules.history import (
-    add_prescription_to_history, 
-    display_history, 
-    display_downloadable_files, 
-    generate_accuracy_chart,
-    display_statistics,
-    show_prescription_details
-)
+
+# Heavy backends (google.genai, PIL, gTTS, matplotlib) are imported inside
+# the commands that need them, so read-only commands start quickly.
 
 DEFAULT_IMAGE_PATH = "samples/sample2.jpeg"
 DEFAULT_LANGUAGE = "Telugu"
 
-def main():
-    # Usage: python app.py [image_path] [language]
-    # Or: python app.py --history
-    # Or: python app.py --files
-    # Or: python app.py --chart
-    # Or: python app.py --stats
-    
-    if len(sys.argv) > 1 and sys.argv[1] == "--history":
-        display_history()
-        return
-    
-    if len(sys.argv) > 1 and sys.argv[1] == "--files":
-        display_downloadable_files()
-        return
-    
-    if len(sys.argv) > 1 and sys.argv[1] == "--chart":
-        chart_file = generate_accuracy_chart()
-        if chart_file:
-            print(f"✅ Accuracy chart generated: {chart_file}")
-        return
-    
-    if len(sys.argv) > 1 and sys.argv[1] == "--stats":
-        display_statistics()
-        return
-    
-    image_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_IMAGE_PATH
-    language = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_LANGUAGE
+# Old flag-style commands, kept working as aliases for the subcommands
+LEGACY_FLAGS = {
+    "--history": "history",
+    "--files": "files",
+    "--chart": "chart",
+    "--stats": "stats",
+}
+
+
+def cmd_history(args):
+    from modules.history import display_history
+    display_history()
+
+
+def cmd_details(args):
+    from modules.history import show_prescription_details
+    show_prescription_details(args.prescription_id)
+
+
+def cmd_stats(args):
+    from modules.history import display_statistics
+    display_statistics()
+
+
+def cmd_files(args):
+    from modules.history import display_downloadable_files
+    display_downloadable_files()
+
+
+def cmd_chart(args):
+    from modules.history import generate_accuracy_chart
+    chart_file = generate_accuracy_chart()
+    if chart_file:
+        print(f"✅ Accuracy chart generated: {chart_file}")
+
+
+def cmd_compact(args):
+    from modules.history import HISTORY_RETENTION_MONTHS, compact_history
+    retention_months = HISTORY_RETENTION_MONTHS if args.retention_months is None else args.retention_months
+    result = compact_history(retention_months)
+    print(f"✅ Compacted {len(result['compacted'])} closed month(s): {', '.join(result['compacted']) or '-'}")
+    print(f"🗑️  Deleted {len(result['deleted'])} month(s) past retention: {', '.join(result['deleted']) or '-'}")
+
+
+def cmd_archive_audio(args):
+    from modules.history import AUDIO_ARCHIVE_DAYS, archive_old_audio
+    days = AUDIO_ARCHIVE_DAYS if args.days is None else args.days
+    count = archive_old_audio(days)
+    print(f"✅ Archived {count} audio file(s) older than {days} days")
+
+
+def cmd_restore_audio(args):
+    from modules.history import extract_archived_audio
+    path = extract_archived_audio(args.filename)
+    if path:
+        print(f"✅ Restored: {path}")
+    else:
+        print(f"Audio file {args.filename} not found in archive.")
+
+
+def cmd_due(args):
+    from modules.history import display_due_doses
+    display_due_doses(args.hours)
+
+
+def cmd_rebuild_schedule(args):
+    from modules.history import rebuild_dose_schedule
+    count = rebuild_dose_schedule()
+    print(f"✅ Dose schedule rebuilt: {count} dose events indexed")
+
+
+def cmd_soak(args):
+    from modules.soak import run_soak
+    report = run_soak(
+        duration_s=args.duration,
+        rate=args.rate,
+        mode=args.mode,
+        concurrency=args.concurrency,
+        sample_interval_s=args.sample_interval,
+        image_path=args.image,
+        report_path=args.report
+    )
+    print(f"\n✅ Completed {report['total_completed']} requests, {report['total_errors']} errors")
+    if report["cancelled_at_deadline"]:
+        print(f"⏹️  {report['cancelled_at_deadline']} queued requests cancelled at the deadline")
+    for finding in report["analysis"]["findings"]:
+        print(f"⚠️  {finding}")
+    if not report["analysis"]["findings"]:
+        print("No leaks or throughput decay detected.")
+    print(f"📄 Report: {report['report_path']}\n")
+
+
+def cmd_batch(args):
+    from modules.jobs import run_batch
+    languages = [language.strip() for language in args.languages.split(",") if language.strip()]
+    run_batch(args.paths, languages, args.journal, workers=args.workers, decode_workers=args.decode_workers)
+
+
+def cmd_process(args):
+    from modules.extractor import extract_prescription, extract_prescription_pages
+    from modules.translate import translate_summary
+    from modules.voice import generate_voice_output
+    from modules.history import add_prescription_to_history
+
+    image_path = args.image_path
+    language = args.language
+
+    # Several pages can be given as a comma-separated list
+    page_paths = [p for p in image_path.split(",") if p]
+    phash = None
+    sha256 = None
+    audio_job = None
 
     # Check if file exists before processing
-    if not os.path.exists(image_path):
-        print(f"Error: File not found at {image_path}")
-        return
+    for path in page_paths:
+        if not os.path.exists(path):
+            print(f"Error: File not found at {path}")
+            return
 
     print(f"\n{'='*80}")
     print(f"Processing prescription: {image_path}...")
@@ -55,7 +133,50 @@ def main():
 
     try:
         # Call the extractor
-        result = extract_prescription(image_path)
+        if len(page_paths) > 1 or image_path.lower().endswith(".pdf"):
+            result = extract_prescription_pages(page_paths)
+            print(f"📄 Pages processed: {result['page_count']}")
+        else:
+            result = None
+            phash = None
+            if not args.no_dedup:
+                from PIL import Image
+                from modules.dedup import compute_phash, file_sha256, find_near_duplicate
+
+                with Image.open(image_path) as img:
+                    phash = compute_phash(img)
+                sha256 = file_sha256(image_path)
+                from modules.history import list_shards
+                match = find_near_duplicate(phash, args.match_threshold, live_months=set(list_shards()))
+                if match:
+                    # A close hash alone is not enough: the letterhead dominates it
+                    entry, distance = match
+                    if entry.get("sha256") == sha256:
+                        confirmed = "identical file"
+                    else:
+                        from modules.extractor import confirm_same_medicines
+                        names = [med["medicine_name"] for med in entry["result"]["structured_data"]]
+                        try:
+                            confirmed = "medicines confirmed" if confirm_same_medicines(image_path, names) else None
+                        except Exception as e:
+                            print(f"⚠️  Could not confirm near-duplicate: {e}")
+                            confirmed = None
+                    if confirmed:
+                        result = dict(entry["result"])
+                        print(f"♻️  Near-duplicate of prescription {entry['prescription_id']} "
+                              f"(distance {distance}, {confirmed}) - reusing its extraction")
+                    else:
+                        print(f"🔎 Looks like prescription {entry['prescription_id']} (distance {distance}) "
+                              f"but the same medicines could not be confirmed - extracting")
+            if result is None:
+                result = extract_prescription(image_path)
+        
+        routing = result.get("routing")
+        if routing:
+            print(f"🤖 Model: {routing['model']} ({routing['latency_ms']} ms"
+                  f"{', escalated' if routing['escalated'] else ''})")
+        if result.get("truncated"):
+            print("⚠️  The model's output was cut off - some medicines may be missing. Check the prescription.")
 
         # Print structured data
         print(f"\n{'─'*80}")
@@ -96,10 +217,11 @@ def main():
             
             # Save to history
             prescription_record = add_prescription_to_history(
-                image_path,
+                page_paths[0],
                 language,
                 result["structured_data"],
-                audio_filename
+                audio_filename,
+                routing=result.get("routing")
             )
             
             print(f"\n{'─'*80}")
@@ -109,15 +231,128 @@ def main():
             print(f"Accuracy Score: {prescription_record['accuracy_score']}%")
             print(f"Audio saved: {prescription_record['audio_file']}")
             
+            if args.audio_profiles != "none":
+                from modules.audio_profiles import ffmpeg_available, submit_audio_profiles
+                profiles = args.audio_profiles.split(",") if args.audio_profiles else None
+                if profiles and not ffmpeg_available():
+                    print("ℹ️  Skipping compact audio profiles: ffmpeg and ffprobe are not installed")
+                audio_job = submit_audio_profiles(prescription_record['id'], prescription_record['audio_file'], profiles)
+            
+            if phash is not None and "routing" in result and not result.get("truncated"):
+                # Only fresh extractions are indexed, not reused ones
+                from modules.dedup import add_to_index
+                add_to_index(phash, result, prescription_record['id'], sha256)
+            
         except Exception as e:
             print(f"⚠️  Could not generate audio: {e}")
         
         print(f"\n{'='*80}\n")
+        
+        if audio_job is not None:
+            # Compact profiles were encoding in the background; wait before exiting
+            for profile, audio in audio_job.result().items():
+                if 'error' in audio:
+                    print(f"⚠️  Audio profile {profile} failed: {audio['error']}")
+                else:
+                    print(f"🎧 {profile}: {audio['path']} ({audio['size_bytes'] / 1024:.1f} KB)")
 
     except Exception as e:
         print(f"An error occurred: {e}")
 
 
+COMMANDS = {
+    "process": cmd_process,
+    "history": cmd_history,
+    "details": cmd_details,
+    "stats": cmd_stats,
+    "chart": cmd_chart,
+    "files": cmd_files,
+    "compact": cmd_compact,
+    "archive-audio": cmd_archive_audio,
+    "restore-audio": cmd_restore_audio,
+    "batch": cmd_batch,
+    "due": cmd_due,
+    "rebuild-schedule": cmd_rebuild_schedule,
+    "soak": cmd_soak,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="app.py", description="Prescription processing system")
+    subparsers = parser.add_subparsers(dest="command")
+
+    process = subparsers.add_parser("process", help="Extract, translate and voice a prescription")
+    process.add_argument("image_path", nargs="?", default=DEFAULT_IMAGE_PATH,
+                         help="Image or PDF path; several pages as a comma-separated list")
+    process.add_argument("language", nargs="?", default=DEFAULT_LANGUAGE)
+    process.add_argument("--no-dedup", action="store_true",
+                         help="Always call the model, even for a near-duplicate photo")
+    process.add_argument("--match-threshold", type=int, default=None,
+                         help="Max Hamming distance for a near-duplicate candidate (confirmed before reuse)")
+    process.add_argument("--audio-profiles", default="",
+                         help="Comma-separated compact audio profiles (mp3-mono, mp3-low, opus) or 'none'; "
+                              "needs ffmpeg. Default: the AUDIO_PROFILES env variable, else none")
+
+    batch = subparsers.add_parser("batch", help="Process many prescriptions, resumable after a crash")
+    batch.add_argument("paths", nargs="+", help="Images, PDFs or folders of them")
+    batch.add_argument("--languages", default=DEFAULT_LANGUAGE, help="Comma-separated languages")
+    batch.add_argument("--journal", default="batch_journal.jsonl",
+                       help="Checkpoint journal; re-run with the same journal to resume")
+    batch.add_argument("--workers", type=int, default=1,
+                       help="Inputs whose API calls run concurrently")
+    batch.add_argument("--decode-workers", type=int, default=0,
+                       help="Processes decoding images ahead of the API calls (0 = decode inline)")
+
+    soak = subparsers.add_parser("soak", help="Long-running load test against local stand-ins")
+    soak.add_argument("--duration", type=float, default=3600, help="Seconds to run")
+    soak.add_argument("--mode", choices=["open", "closed"], default="open",
+                      help="open: Poisson arrivals at --rate; closed: --concurrency back-to-back workers")
+    soak.add_argument("--rate", type=float, default=2.0, help="Arrivals per second (open mode)")
+    soak.add_argument("--concurrency", type=int, default=4, help="Workers (closed mode)")
+    soak.add_argument("--sample-interval", type=float, default=10.0, help="Seconds between samples")
+    soak.add_argument("--image", default=DEFAULT_IMAGE_PATH)
+    soak.add_argument("--report", default=None, help="Report path (JSON)")
+
+    subparsers.add_parser("history", help="View all prescriptions")
+    details = subparsers.add_parser("details", help="View one prescription")
+    details.add_argument("prescription_id")
+    subparsers.add_parser("stats", help="View overall statistics")
+    subparsers.add_parser("chart", help="Generate accuracy chart")
+    subparsers.add_parser("files", help="List downloadable audio files")
+    due = subparsers.add_parser("due", help="Doses due soon across all prescriptions")
+    due.add_argument("--hours", type=int, default=1)
+    subparsers.add_parser("rebuild-schedule", help="Rebuild the dose reminder index from history")
+
+    # Defaults are resolved from modules.history when the command runs
+    compact = subparsers.add_parser("compact", help="Compress closed history months and apply retention")
+    compact.add_argument("--retention-months", type=int,
+                         help="Months of history to keep (default: HISTORY_RETENTION_MONTHS or 24)")
+    archive = subparsers.add_parser("archive-audio", help="Bundle old audio files into compressed archives")
+    archive.add_argument("--days", type=int,
+                         help="Archive audio older than this (default: AUDIO_ARCHIVE_DAYS or 90)")
+    restore = subparsers.add_parser("restore-audio", help="Extract an archived audio file")
+    restore.add_argument("filename")
+
+    return parser
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+
+    if argv and argv[0] in LEGACY_FLAGS:
+        argv[0] = LEGACY_FLAGS[argv[0]]
+    elif argv and argv[0] not in COMMANDS and not argv[0].startswith("-"):
+        # python app.py <image_path> <language>
+        argv.insert(0, "process")
+
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        show_menu()
+        return
+
+    COMMANDS[args.command](args)
+
+
 def show_menu():
     """Display available commands."""
     print(f"\n{'='*80}")
@@ -125,17 +360,23 @@ def show_menu():
     print(f"{'='*80}\n")
     print("Process Prescription:")
     print("  python app.py <image_path> <language>")
-    print("  Example: python app.py samples/sample2.jpeg Telugu\n")
+    print("  Example: python app.py samples/sample2.jpeg Telugu")
+    print("  Multi-page: python app.py page1.jpeg,page2.jpeg Telugu")
+    print("  PDF: python app.py discharge_sheet.pdf Hindi")
+    print("  Batch: python app.py batch samples/ --languages Telugu,Hindi\n")
     print("View History:")
-    print("  python app.py --history           # View all prescriptions")
-    print("  python app.py --stats             # View overall statistics")
-    print("  python app.py --chart             # Generate accuracy chart\n")
+    print("  python app.py history             # View all prescriptions")
+    print("  python app.py details <id>        # View one prescription")
+    print("  python app.py stats               # View overall statistics")
+    print("  python app.py chart               # Generate accuracy chart")
+    print("  python app.py due --hours 1       # Doses due in the next hour\n")
     print("Download Files:")
-    print("  python app.py --files             # List downloadable audio files\n")
+    print("  python app.py files               # List downloadable audio files")
+    print("  python app.py restore-audio <file> # Extract an archived audio file\n")
+    print("Maintenance:")
+    print("  python app.py compact             # Compress closed history months")
+    print("  python app.py archive-audio       # Archive audio older than 90 days\n")
     print(f"{'='*80}\n")
 
 if __name__ == "__main__":
-    if len(sys.argv) == 1:
-        show_menu()
-    else:
-        main()
+    main()
@@ -0,0 +1,60 @@
+"""
+Compares audio output profiles: bytes per second of speech per language.
+
+Generates a sample summary with gTTS for each language (needs network
+access and ffmpeg), then encodes it with every profile.
+
+Usage: python -m benchmarks.audio_profiles [Language ...]
+"""
+import os
+import sys
+import tempfile
+from modules.audio_profiles import AUDIO_PROFILES, apply_audio_profile, describe_audio
+from modules.voice import generate_voice_output
+
+SAMPLE_TEXT = {
+    "English": "You have been prescribed the following medicines: "
+               "1. Tablet Sompraz 40 milligrams: Take 1 tablet before morning meal and 1 tablet "
+               "before night meal, every day for 1 month. 2. Syrup Dolcid: Take 15 millilitres "
+               "before food at 9 AM and 15 millilitres before food at 9 PM, every day for 1 month.",
+    "Hindi": "आपको निम्नलिखित दवाइयाँ दी गई हैं: 1. टैबलेट सोमप्राज़ 40 मिलीग्राम: सुबह के भोजन से पहले "
+             "1 गोली और रात के भोजन से पहले 1 गोली, 1 महीने तक हर दिन लें।",
+    "Telugu": "మీకు ఈ క్రింది మందులు సూచించబడ్డాయి: 1. టాబ్లెట్ సోంప్రాజ్ 40 మిల్లీగ్రాములు: ఉదయం భోజనానికి "
+              "ముందు 1 మాత్ర మరియు రాత్రి భోజనానికి ముందు 1 మాత్ర, 1 నెల పాటు ప్రతిరోజూ తీసుకోండి.",
+    "Tamil": "உங்களுக்கு பின்வரும் மருந்துகள் பரிந்துரைக்கப்பட்டுள்ளன: 1. மாத்திரை சோம்ப்ராஸ் 40 மில்லிகிராம்: "
+             "காலை உணவுக்கு முன் 1 மாத்திரை மற்றும் இரவு உணவுக்கு முன் 1 மாத்திரை, 1 மாதம் தினமும் எடுத்துக்கொள்ளுங்கள்.",
+}
+
+
+def main():
+    languages = sys.argv[1:] or list(SAMPLE_TEXT)
+
+    print(f"\n{'='*80}")
+    print("AUDIO PROFILE BENCHMARK (bytes per second of speech)")
+    print(f"{'='*80}\n")
+
+    header = f"{'Language':<10} {'Profile':<10} {'Size':>10} {'Duration':>10} {'Bytes/s':>10} {'vs gTTS':>8}"
+    print(header)
+    print("-" * len(header))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for language in languages:
+            source = os.path.join(workdir, f"{language}.mp3")
+            generate_voice_output(SAMPLE_TEXT[language], language, source)
+
+            original = describe_audio(source)
+            rows = [("gTTS", original)]
+            for profile in AUDIO_PROFILES:
+                rows.append((profile, apply_audio_profile(source, profile)))
+
+            for profile, audio in rows:
+                # Rate against the original speech length, since trimming shortens the file
+                rate = audio["size_bytes"] / original["duration_sec"]
+                ratio = audio["size_bytes"] / original["size_bytes"]
+                print(f"{language:<10} {profile:<10} {audio['size_bytes']:>10,} "
+                      f"{audio['duration_sec']:>9.1f}s {rate:>10,.0f} {ratio:>7.0%}")
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Measures image decode throughput as decode processes are added.
+
+Each round decodes, resizes and re-encodes every sample prescription
+(repeated --repeat times) and reports images per second: first inline
+on one thread, then through ImageDecodePool with 1, 2, 4 ... workers up
+to the core count.
+
+Usage: python -m benchmarks.image_pool [folder] [--repeat N]
+"""
+import argparse
+import glob
+import os
+import time
+from modules.image_pool import ImageDecodePool, prepare_image
+
+
+def run_inline(paths):
+    for path in paths:
+        prepare_image(path).release()
+
+
+def run_pool(paths, workers):
+    with ImageDecodePool(workers) as pool:
+        for future in [pool.submit(path) for path in paths]:
+            future.result().release()
+
+
+def worker_counts():
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("folder", nargs="?", default="samples")
+    parser.add_argument("--repeat", type=int, default=3, help="Times to decode each sample per round")
+    args = parser.parse_args()
+
+    samples = sorted(glob.glob(os.path.join(args.folder, "*.jp*g")) + glob.glob(os.path.join(args.folder, "*.png")))
+    if not samples:
+        print(f"No images found in {args.folder}")
+        return
+    paths = samples * args.repeat
+
+    print(f"\n{'='*80}")
+    print(f"IMAGE DECODE BENCHMARK ({len(samples)} samples x {args.repeat}, {os.cpu_count()} cores)")
+    print(f"{'='*80}\n")
+
+    header = f"{'Mode':<16} {'Seconds':>8} {'Images/s':>10} {'Speed-up':>9}"
+    print(header)
+    print("-" * len(header))
+
+    # Warm up imports so the inline round isn't charged for them
+    run_inline(samples[:1])
+
+    start = time.perf_counter()
+    run_inline(paths)
+    baseline = time.perf_counter() - start
+    print(f"{'inline':<16} {baseline:>8.2f} {len(paths) / baseline:>10.1f} {1.0:>8.2f}x")
+
+    for workers in worker_counts():
+        start = time.perf_counter()
+        run_pool(paths, workers)
+        elapsed = time.perf_counter() - start
+        print(f"{f'pool x{workers}':<16} {elapsed:>8.2f} {len(paths) / elapsed:>10.1f} {baseline / elapsed:>8.2f}x")
+    print()
+
+
+if __name__ == "__main__":
+    main()
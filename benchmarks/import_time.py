@@ -0,0 +1,115 @@
+"""
+Start-up budget check for the CLI.
+
+Runs each read-only command under ``python -X importtime`` and fails if
+its cumulative import time exceeds the budget, or if it pulls in one of
+the heavy backends that only ``process`` should need.
+
+Usage: python -m benchmarks.import_time
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Budget per command, in milliseconds, for imports made by the app itself.
+# Interpreter start-up imports (site, encodings, .pth hooks) are excluded:
+# they depend on the environment, not on this code.
+BUDGETS_MS = {
+    "history": 50,
+    "stats": 50,
+    "files": 50,
+    "details": 50,
+}
+
+# Best of several runs, to keep scheduler noise out of the budget check
+REPEAT = 3
+
+HEAVY_MODULES = ["google.genai", "PIL", "gtts", "matplotlib", "deep_translator"]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parse_importtime(stderr):
+    """Return [(module name, cumulative us, is top level)] from -X importtime output."""
+    entries = []
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((name.strip(), int(cumulative), not name.startswith("  ")))
+    return entries
+
+
+def startup_modules():
+    """Modules the bare interpreter imports before running any script."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "pass"],
+                               capture_output=True, text=True)
+    return {name for name, _, _ in _parse_importtime(completed.stderr)}
+
+
+def measure(command, baseline=frozenset()):
+    """
+    Runs ``app.py <command>`` with -X importtime.
+
+    Returns:
+        Tuple of (total import time in ms, wall time in ms, imported module names)
+    """
+    argv = [sys.executable, "-X", "importtime", os.path.join(REPO_ROOT, "app.py"), command]
+    if command == "details":
+        argv.append("20000101_000000")
+
+    # Run in an empty directory so the commands never touch real history
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        completed = subprocess.run(argv, cwd=workdir, capture_output=True, text=True)
+        wall_ms = (time.perf_counter() - started) * 1000
+
+    total_us = 0
+    modules = set()
+    for name, cumulative, top_level in _parse_importtime(completed.stderr):
+        modules.add(name)
+        # Top-level imports have no indentation; their cumulative times add up
+        if top_level and name not in baseline:
+            total_us += cumulative
+
+    return total_us / 1000, wall_ms, modules
+
+
+def main():
+    print(f"\n{'='*80}")
+    print("CLI IMPORT-TIME BENCHMARK")
+    print(f"{'='*80}\n")
+
+    baseline = startup_modules()
+    failures = []
+    for command, budget in BUDGETS_MS.items():
+        runs = [measure(command, baseline) for _ in range(REPEAT)]
+        import_ms = min(run[0] for run in runs)
+        wall_ms = min(run[1] for run in runs)
+        modules = runs[0][2]
+        heavy = [m for m in HEAVY_MODULES if m in modules]
+
+        status = "OK"
+        if import_ms > budget:
+            status = "OVER BUDGET"
+            failures.append(f"{command}: {import_ms:.1f} ms > {budget} ms")
+        if heavy:
+            status = "HEAVY IMPORT"
+            failures.append(f"{command}: imports {', '.join(heavy)}")
+
+        print(f"{command:<10} imports {import_ms:7.1f} ms (budget {budget} ms)  "
+              f"wall {wall_ms:7.1f} ms  {status}")
+
+    print()
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("✅ All commands within budget\n")
+
+
+if __name__ == "__main__":
+    main()
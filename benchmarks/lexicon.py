@@ -0,0 +1,96 @@
+"""
+Lookup latency of the medicine lexicon at production scale.
+
+Generates a synthetic sorted lexicon (300,000 names by default) in a
+temporary folder, then times the one-off trigram index build, opening
+the lexicon, and exact, prefix and fuzzy lookups.
+
+Usage: python -m benchmarks.lexicon [entries]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from modules.lexicon import MedicineLexicon, _trigrams, build_trigram_index
+
+CONSONANTS = "BCDFGHKLMNPRSTVXZ"
+VOWELS = "AEIOUY"
+SUFFIXES = ["", "", "", " LS", " DSR", " PLUS", " FORTE", " XR", " MR", " D"]
+
+
+def make_names(count, seed=7):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        # Brand-like names: 2-4 consonant-vowel syllables, sometimes closed
+        stem = "".join(
+            rng.choice(CONSONANTS) + rng.choice(VOWELS) + (rng.choice(CONSONANTS) if rng.random() < 0.3 else "")
+            for _ in range(rng.randint(2, 4))
+        )
+        names.add(stem + rng.choice(SUFFIXES))
+    return sorted(names)
+
+
+def misspell(name, rng):
+    position = rng.randrange(len(name))
+    return name[:position] + rng.choice("AEIOULNR") + name[position + 1:]
+
+
+def _dice(a, b):
+    a, b = _trigrams(a), _trigrams(b)
+    return round(2 * len(a & b) / (len(a) + len(b)), 2)
+
+
+def _per_call_us(fn, queries):
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    rng = random.Random(11)
+
+    print(f"\n{'='*80}")
+    print(f"LEXICON BENCHMARK ({count:,} entries)")
+    print(f"{'='*80}\n")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "lexicon.txt")
+        names = make_names(count)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(names) + "\n")
+
+        start = time.perf_counter()
+        lexicon = MedicineLexicon(path)
+        print(f"{'open (offsets scan)':<24} {(time.perf_counter() - start) * 1e3:10.1f} ms")
+
+        start = time.perf_counter()
+        build_trigram_index(lexicon, lexicon.index_path)
+        print(f"{'index build (one-off)':<24} {(time.perf_counter() - start) * 1e3:10.1f} ms")
+
+        # The first fuzzy call imports numpy and maps the persisted index
+        start = time.perf_counter()
+        lexicon.fuzzy(names[0])
+        print(f"{'first fuzzy':<24} {(time.perf_counter() - start) * 1e3:10.1f} ms\n")
+
+        sample = rng.sample(names, 2000)
+        typos = [misspell(name, rng) for name in sample]
+        print(f"{'exact lookup':<24} {_per_call_us(lexicon.lookup, sample):10.1f} us")
+        print(f"{'prefix lookup':<24} {_per_call_us(lambda n: lexicon.prefix(n[:4]), sample):10.1f} us")
+        print(f"{'fuzzy (typo)':<24} {_per_call_us(lexicon.fuzzy, typos):10.1f} us")
+
+        # Synthetic names are close to each other, so a typo often has other
+        # matches as good as the original; count those as found too
+        found = 0
+        for typo, name in zip(typos, sample):
+            match, score = lexicon.fuzzy(typo)
+            found += match == name or score >= _dice(typo, name)
+        print(f"{'fuzzy finds best match':<24} {found / len(sample):10.0%}\n")
+        lexicon.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Checks the fast-tier thresholds against a labelled split of samples/.
+
+Only printed prescriptions should start on the fast tier; a handwritten
+one routed there usually costs an escalation (an extra model call).
+
+Usage: python -m benchmarks.routing_thresholds
+"""
+import os
+from PIL import Image
+from modules.routing import CLEAN_MIN_CONTRAST, CLEAN_MIN_SHARPNESS, assess_image_quality, choose_start_tier
+
+SAMPLES_FOLDER = "samples"
+
+# Typed medicine lists, discharge summaries and diet charts; everything
+# else in samples/ is handwritten
+PRINTED = {"sample2.jpeg", "sample10.jpeg", "sample14.jpeg", "sample17.jpeg"}
+
+
+def main():
+    print(f"\n{'='*80}")
+    print(f"ROUTING THRESHOLDS (contrast >= {CLEAN_MIN_CONTRAST}, sharpness >= {CLEAN_MIN_SHARPNESS})")
+    print(f"{'='*80}\n")
+
+    header = f"{'Sample':<16} {'Label':<12} {'Contrast':>9} {'Sharpness':>10}  Start tier"
+    print(header)
+    print("-" * len(header))
+
+    printed_fast = handwritten_fast = handwritten = 0
+    files = sorted(f for f in os.listdir(SAMPLES_FOLDER) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    for file in files:
+        with Image.open(os.path.join(SAMPLES_FOLDER, file)) as img:
+            quality = assess_image_quality(img)
+        fast = choose_start_tier(quality) == 0
+        label = "printed" if file in PRINTED else "handwritten"
+        if file in PRINTED:
+            printed_fast += fast
+        else:
+            handwritten += 1
+            handwritten_fast += fast
+        print(f"{file:<16} {label:<12} {quality['contrast']:>9.2f} {quality['sharpness']:>10.2f}  "
+              f"{'fast' if fast else 'standard'}")
+
+    print(f"\nPrinted on fast tier:     {printed_fast}/{len(PRINTED)}")
+    print(f"Handwritten on fast tier: {handwritten_fast}/{handwritten}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark for the TTS text normalizer.
+
+Known inputs are checked first; the script exits non-zero if any of them
+normalize differently.
+
+Usage: python -m benchmarks.tts_normalizer
+"""
+import sys
+import time
+from modules.voice import preprocess_text_for_tts
+
+SAMPLE_SUMMARY = """You have been prescribed the following medicines:
+1. TAB. SOMPRAZ 40MG: Take 1 tablet before morning meal and 1 tablet before night meal, every day for 1 month.
+2. TAB. DILNIP T 40MG: Take 1 tablet after morning meal at 9 AM, every day for 1 month.
+3. TAB. ROZAVEL EZ: Take 1 tablet after night meal at 9 PM, every day for 1 month.
+4. TAB. MYOSPAS: Take 1 tablet after morning meal at 10 AM and 1 tablet after night meal at 10 PM, every day for 3 days.
+5. SYP. DOLCID SYP: Take 15 ML before morning meal at 9 AM and 15 ML before night meal at 9 PM, every day for 1 month.
+6. TAB. D-RISE 60K: Take 1 tablet after night meal at 9 PM, monthly for 8 weeks.
+7. GEL NANOFASST: Apply once in the morning and once in the night to the affected area, as needed, until your next visit.
+"""
+
+HINDI_SUMMARY = "1. टैब. SOMPRAZ 40MG: सुबह के भोजन से पहले 1 गोली, 15 एमएल रात को।\n" * 7
+
+
+# (language, input, expected) pairs checked before timing, so a faster
+# normalizer can't silently change what is spoken
+EXPECTED = [
+    ("English", "1. TAB. SOMPRAZ 40MG: Take 15 ML.", "1. Tablet Sompraz 40 milligrams: Take 15 millilitres."),
+    ("English", "Take 1 CAP OD after food.", "Take 1 Capsule once a day after food."),
+    # Names are spoken as extracted, even when a similar drug is in the lexicon
+    ("English", "1. TAB. DOLONEX: Take 1.", "1. Tablet Dolonex: Take 1."),
+    # Word rules must not fire inside words the translator already spelled out
+    ("Hindi", "1 टैबलेट सुबह लें", "1 टैबलेट सुबह लें"),
+    ("Hindi", "1 टैब सुबह, 10एमजी", "1 टैबलेट सुबह, 10मिलीग्राम"),
+]
+
+
+def check_expected():
+    failures = 0
+    for language, text, expected in EXPECTED:
+        actual = preprocess_text_for_tts(text, language)
+        if actual != expected:
+            failures += 1
+            print(f"❌ {language}: {text!r} -> {actual!r}, expected {expected!r}")
+    return failures
+
+
+def _run(label, texts, language, repeat=5):
+    total_chars = sum(len(t) for t in texts)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            preprocess_text_for_tts(text, language)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"{label:<32} {len(texts):>7} texts  {total_chars / best / 1e6:8.2f} MB/s  "
+          f"{len(texts) / best:12,.0f} texts/s")
+
+
+def main():
+    if check_expected():
+        sys.exit(1)
+
+    # Compile the per-language patterns outside the timed loop
+    preprocess_text_for_tts("", "English")
+    preprocess_text_for_tts("", "Hindi")
+
+    print(f"\n{'='*80}")
+    print("TTS NORMALIZER BENCHMARK (best of 5)")
+    print(f"{'='*80}\n")
+    _run("Large summary (English)", [SAMPLE_SUMMARY * 2000], "English")
+    _run("Large summary (Hindi)", [HINDI_SUMMARY * 2000], "Hindi")
+    _run("Batch of summaries (English)", [SAMPLE_SUMMARY] * 10000, "English")
+    _run("Batch of summaries (Hindi)", [HINDI_SUMMARY] * 10000, "Hindi")
+    print()
+
+
+if __name__ == "__main__":
+    main()
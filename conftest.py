@@ -0,0 +1,3 @@
+# test_workflow.py is an end-to-end script: it calls the translation and
+# TTS services and writes to the real history. Run it directly instead.
+collect_ignore = ["test_workflow.py"]
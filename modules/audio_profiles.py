@@ -0,0 +1,151 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Output profiles for delivery over slow mobile networks and messaging apps.
+AUDIO_PROFILES = {
+    "mp3-mono": {
+        "extension": "mp3",
+        "codec": "libmp3lame",
+        "bitrate": "32k",
+        "sample_rate": 22050,
+        "trim_silence": True,
+        "normalize": True
+    },
+    "mp3-low": {
+        "extension": "mp3",
+        "codec": "libmp3lame",
+        "bitrate": "16k",
+        "sample_rate": 16000,
+        "trim_silence": True,
+        "normalize": True
+    },
+    "opus": {
+        "extension": "ogg",
+        "codec": "libopus",
+        "bitrate": "12k",
+        "sample_rate": 16000,
+        "trim_silence": True,
+        "normalize": True
+    }
+}
+
+# Opt-in, since encoding needs ffmpeg/ffprobe on PATH (e.g. AUDIO_PROFILES=mp3-mono,opus)
+DEFAULT_AUDIO_PROFILES = [
+    name.strip() for name in os.getenv("AUDIO_PROFILES", "").split(",") if name.strip()
+]
+
+# Shortens pauses longer than 0.6s and loudness-normalizes to a speech target
+SILENCE_FILTER = "silenceremove=start_periods=1:start_threshold=-45dB:stop_periods=-1:stop_duration=0.6:stop_threshold=-45dB"
+LOUDNESS_FILTER = "loudnorm=I=-16:TP=-1.5:LRA=11"
+
+_executor = None
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def get_audio_duration(path):
+    """Duration of an audio file in seconds, using ffprobe (None if unavailable)."""
+    if shutil.which("ffprobe") is None:
+        return None
+    completed = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True, text=True
+    )
+    try:
+        return round(float(completed.stdout.strip()), 2)
+    except ValueError:
+        return None
+
+
+def describe_audio(path):
+    """Size and duration of an audio file, as stored in history."""
+    return {
+        "path": path,
+        "size_bytes": os.path.getsize(path),
+        "duration_sec": get_audio_duration(path)
+    }
+
+
+def apply_audio_profile(source_path, profile_name, output_path=None):
+    """
+    Re-encodes an audio file with one of AUDIO_PROFILES.
+
+    Args:
+        source_path: The audio file written by gTTS
+        profile_name: Key of AUDIO_PROFILES
+        output_path: Optional output path; defaults to the source path
+            with the profile name appended
+
+    Returns:
+        Dict with the output path, size in bytes and duration in seconds
+    """
+    if profile_name not in AUDIO_PROFILES:
+        raise ValueError(f"Unknown audio profile: {profile_name}")
+    if not ffmpeg_available():
+        raise ValueError("Audio profiles require ffmpeg and ffprobe on PATH.")
+
+    profile = AUDIO_PROFILES[profile_name]
+    if output_path is None:
+        base, _ = os.path.splitext(source_path)
+        output_path = f"{base}_{profile_name}.{profile['extension']}"
+
+    filters = []
+    if profile["trim_silence"]:
+        filters.append(SILENCE_FILTER)
+    if profile["normalize"]:
+        filters.append(LOUDNESS_FILTER)
+
+    command = ["ffmpeg", "-y", "-v", "error", "-i", source_path, "-vn", "-ac", "1",
+               "-ar", str(profile["sample_rate"])]
+    if filters:
+        command += ["-af", ",".join(filters)]
+    command += ["-c:a", profile["codec"], "-b:a", profile["bitrate"]]
+    if profile["codec"] == "libopus":
+        command += ["-application", "voip"]
+    command.append(output_path)
+
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise ValueError(f"ffmpeg failed for profile {profile_name}: {completed.stderr.strip()}")
+
+    return describe_audio(output_path)
+
+
+def _process_profiles(prescription_id, audio_path, profiles):
+    from modules.history import update_prescription_record
+
+    results = {"original": describe_audio(audio_path)}
+    for profile_name in profiles:
+        try:
+            results[profile_name] = apply_audio_profile(audio_path, profile_name)
+        except ValueError as e:
+            results[profile_name] = {"error": str(e)}
+
+    update_prescription_record(prescription_id, {"audio_profiles": results})
+    return results
+
+
+def submit_audio_profiles(prescription_id, audio_path, profiles=None):
+    """
+    Encodes the compact audio profiles in a background thread, so the
+    patient gets the default MP3 without waiting for post-processing.
+    The sizes and durations are written to the history record when done.
+
+    Returns:
+        A Future resolving to the per-profile results, or None when no
+        profiles are requested or ffmpeg is not installed.
+    """
+    global _executor
+
+    if profiles is None:
+        profiles = DEFAULT_AUDIO_PROFILES
+    if not profiles or not ffmpeg_available():
+        return None
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="audio-profiles")
+
+    return _executor.submit(_process_profiles, prescription_id, audio_path, profiles)
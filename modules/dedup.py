@@ -0,0 +1,258 @@
+import hashlib
+import json
+import math
+import os
+from datetime import datetime
+
+PHASH_INDEX_FILE = "phash_index.json"
+# One line per lookup, appended, so a lookup never rewrites the index
+PHASH_LOOKUP_LOG = "phash_lookups.jsonl"
+
+# Maximum Hamming distance (out of 64 bits) for two photos to be candidate
+# duplicates. The hash is global, so the letterhead and framing dominate it:
+# a page with its whole medicine block rewritten can be 10 bits away. A
+# match is only a candidate; reuse also needs an identical file or a model
+# check of the medicine names. Override with PHASH_MATCH_THRESHOLD.
+PHASH_MATCH_THRESHOLD = int(os.getenv("PHASH_MATCH_THRESHOLD", "4"))
+
+HASH_SIZE = 8
+THUMBNAIL_SIZE = 32
+
+_index = None
+
+# DCT-II basis for the low frequencies of a THUMBNAIL_SIZE signal
+_DCT_TABLE = [
+    [math.cos(math.pi * (2 * x + 1) * u / (2 * THUMBNAIL_SIZE)) for x in range(THUMBNAIL_SIZE)]
+    for u in range(HASH_SIZE)
+]
+
+
+def compute_phash(img):
+    """
+    64-bit perceptual hash of an image.
+
+    The image is reduced to a 32x32 grayscale thumbnail, the low 8x8
+    frequencies of its DCT are kept and each bit records whether a
+    coefficient is above the median. Small changes in angle, lighting or
+    JPEG quality flip only a few bits.
+    """
+    from PIL import Image, ImageOps
+
+    thumb = ImageOps.grayscale(ImageOps.exif_transpose(img)).resize(
+        (THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS
+    )
+    pixels = list(thumb.getdata())
+    rows = [pixels[i:i + THUMBNAIL_SIZE] for i in range(0, len(pixels), THUMBNAIL_SIZE)]
+
+    # Separable 2D DCT, computing only the coefficients the hash keeps
+    row_dct = [[sum(b * p for b, p in zip(basis, row)) for basis in _DCT_TABLE] for row in rows]
+    coefficients = [
+        sum(_DCT_TABLE[v][y] * row_dct[y][u] for y in range(THUMBNAIL_SIZE))
+        for v in range(HASH_SIZE)
+        for u in range(HASH_SIZE)
+    ]
+
+    # The DC term only reflects overall brightness
+    median = sorted(coefficients[1:])[len(coefficients) // 2 - 1]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (1 if coefficient > median else 0)
+    return value
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's bytes, to recognise an identical upload."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """BK-tree over 64-bit hashes for Hamming-distance range queries."""
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, item):
+        self._size += 1
+        node = (value, item, {})
+        if self._root is None:
+            self._root = node
+            return
+
+        current = self._root
+        while True:
+            distance = hamming_distance(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, max_distance):
+        """Return [(distance, item)] within ``max_distance``, closest first."""
+        if self._root is None:
+            return []
+
+        matches = []
+        stack = [self._root]
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                matches.append((distance, item))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+def _build_tree(entries):
+    tree = BKTree()
+    for entry in entries:
+        tree.add(int(entry["hash"], 16), entry)
+    return tree
+
+
+def load_index():
+    """Load the hash index and build its BK-tree (cached after first load)."""
+    global _index
+
+    if _index is None:
+        data = {"entries": []}
+        if os.path.exists(PHASH_INDEX_FILE):
+            with open(PHASH_INDEX_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        _index = {"data": data, "tree": _build_tree(data["entries"])}
+
+    return _index
+
+
+def save_index():
+    index = load_index()
+    tmp_path = PHASH_INDEX_FILE + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index["data"], f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, PHASH_INDEX_FILE)
+
+
+def _entry_month(entry):
+    """History shard ("YYYY-MM") holding the entry's prescription."""
+    prescription_id = entry["prescription_id"]
+    return f"{prescription_id[:4]}-{prescription_id[4:6]}"
+
+
+def prune_index(live_months):
+    """
+    Drop entries whose history shard no longer exists, so photos of
+    deleted prescriptions are never reused.
+
+    Returns:
+        Number of entries removed.
+    """
+    if not os.path.exists(PHASH_INDEX_FILE):
+        return 0
+
+    index = load_index()
+    entries = index["data"]["entries"]
+    kept = [entry for entry in entries if _entry_month(entry) in live_months]
+    removed = len(entries) - len(kept)
+    if removed:
+        index["data"]["entries"] = kept
+        index["tree"] = _build_tree(kept)
+        save_index()
+    return removed
+
+
+def _log_lookup(hit, distance):
+    entry = {"date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "hit": hit, "distance": distance}
+    with open(PHASH_LOOKUP_LOG, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def find_near_duplicate(phash, threshold=None, live_months=None):
+    """
+    Look for an earlier prescription photo within ``threshold`` bits.
+
+    Args:
+        live_months: History months that still exist; matches from other
+            months are ignored and pruned from the index.
+
+    Returns:
+        Tuple of (entry, distance) for the closest match, or None.
+        Entries hold the prescription_id and the stored extraction result.
+    """
+    if threshold is None:
+        threshold = PHASH_MATCH_THRESHOLD
+
+    index = load_index()
+    matches = index["tree"].search(phash, threshold)
+    if live_months is not None:
+        live = [(distance, entry) for distance, entry in matches if _entry_month(entry) in live_months]
+        if len(live) < len(matches):
+            prune_index(live_months)
+        matches = live
+
+    _log_lookup(bool(matches), matches[0][0] if matches else None)
+
+    if not matches:
+        return None
+    distance, entry = matches[0]
+    return entry, distance
+
+
+def add_to_index(phash, result, prescription_id, sha256=None):
+    """Remember the extraction result for this photo's hash (and file hash)."""
+    index = load_index()
+    entry = {
+        "hash": f"{phash:016x}",
+        "sha256": sha256,
+        "prescription_id": prescription_id,
+        "result": {
+            "structured_data": result["structured_data"],
+            "patient_summary": result.get("patient_summary", "")
+        }
+    }
+    index["data"]["entries"].append(entry)
+    index["tree"].add(phash, entry)
+    save_index()
+
+
+def get_dedup_statistics():
+    """Lookup and hit counts for the near-duplicate index."""
+    if not os.path.exists(PHASH_INDEX_FILE):
+        return None
+
+    index = load_index()
+    # Counters kept inside the index by older versions
+    legacy = index["data"].get("stats", {})
+    lookups = legacy.get("lookups", 0)
+    hits = legacy.get("hits", 0)
+    if os.path.exists(PHASH_LOOKUP_LOG):
+        with open(PHASH_LOOKUP_LOG, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    hit = json.loads(line)["hit"]
+                except (json.JSONDecodeError, KeyError):
+                    continue
+                lookups += 1
+                hits += bool(hit)
+
+    return {
+        "indexed_images": len(index["tree"]),
+        "lookups": lookups,
+        "hits": hits,
+        "hit_rate": round(100 * hits / lookups, 2) if lookups else 0.0
+    }
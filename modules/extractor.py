@@ -1,11 +1,47 @@
 import os
-import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from dotenv import load_dotenv
 from google import genai
+from google.genai import types
 from PIL import Image
+from modules.refine import refine_uncertain_medicines, uncertain_medicines
+from modules.routing import (
+    MODEL_TIERS,
+    assess_image_quality,
+    choose_start_tier,
+    combine_routing,
+    escalation_reason,
+    log_routing_decision
+)
+from modules.schema import (
+    MISSING_VALUE,
+    RESPONSE_SCHEMA,
+    build_missing_fields_schema,
+    medicine_key,
+    parse_extraction,
+    repair_truncated_json,
+    validate_re_asked_value
+)
 
 _client = None
 
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+# Re-read low-confidence lines from cropped regions before escalating a tier
+REFINE_BEFORE_ESCALATING = os.getenv("REFINE_BEFORE_ESCALATING", "1") != "0"
+
+# Pages extracted concurrently for multi-page prescriptions.
+MAX_PAGE_WORKERS = 4
+PDF_RENDER_DPI = 200
+
+# Matches "1. TAB. SOMPRAZ 40MG: Take 1 tablet ..." lines in patient summaries.
+SUMMARY_LINE_PATTERN = re.compile(r"^\d+\.\s*(.+?):\s*(.+)$")
+
+# Fields a summary line is written from; a merge that changes one rebuilds the line.
+SUMMARY_FIELDS = ("dosage_pattern", "frequency", "duration", "food_instruction")
+
 
 PROMPT = """
 You are a medical prescription processing AI.
@@ -64,11 +100,49 @@ Return ONLY valid JSON in this format:
 }
 """
 
+# Fields worth a targeted re-ask when the model leaves them out.
+REASK_FIELDS = {
+    "dosage_pattern",
+    "frequency",
+    "duration",
+    "food_instruction",
+    "confidence_note",
+    "patient_summary"
+}
 
-def extract_prescription(image_path):
-    """
-    Takes image path and returns structured JSON + summary.
-    """
+REASK_PROMPT = """
+Look at this prescription image again. For each medicine listed below,
+return ONLY these fields: {fields}.
+
+Medicines:
+{medicines}
+
+Use the medicine_name exactly as given. Do NOT guess; if a value is not
+written on the prescription, write "unclear".
+"""
+
+# Confirms a near-duplicate photo before its earlier extraction is reused
+CONFIRM_PROMPT = """
+An earlier photo of a prescription listed these medicines:
+{medicines}
+
+Look at this prescription image. Answer:
+- all_listed_present: true only if EVERY listed medicine is written on it
+- other_medicines: true if ANY medicine not in the list is written on it
+"""
+
+CONFIRM_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "all_listed_present": {"type": "BOOLEAN"},
+        "other_medicines": {"type": "BOOLEAN"}
+    },
+    "required": ["all_listed_present", "other_medicines"]
+}
+
+
+def _get_client():
+    """Return the cached Gemini client, creating it on first use."""
     global _client
 
     if _client is None:
@@ -80,32 +154,368 @@ def extract_prescription(image_path):
 
         _client = genai.Client(api_key=api_key)
 
-    img = Image.open(image_path)
+    return _client
 
-    response = _client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=[PROMPT, img],
+
+def _generate(client, contents, schema, model=DEFAULT_MODEL, max_output_tokens=4096):
+    """Call Gemini in JSON mode, constrained to ``schema``."""
+    return client.models.generate_content(
+        model=model,
+        contents=contents,
         config={
             "temperature": 0.1,
-            "max_output_tokens": 4096,
+            "max_output_tokens": max_output_tokens,
+            "response_mime_type": "application/json",
+            "response_schema": schema,
         }
     )
 
-    raw_text = response.text.strip()
 
-    # Sometimes Gemini wraps output in ```json
-    if raw_text.startswith("```"):
-        raw_text = raw_text.replace("```json", "").replace("```", "").strip()
+def _reask_missing_fields(client, img, result, missing, model=DEFAULT_MODEL):
+    """
+    Asks the model again for only the fields that were missing, instead
+    of re-running the whole extraction. Fills ``result`` in place.
+    """
+    fields = sorted({field for _, field in missing})
+    names = sorted({
+        result["structured_data"][index]["medicine_name"]
+        for index, _ in missing if index is not None
+    })
+
+    prompt = REASK_PROMPT.format(
+        fields=", ".join(fields),
+        medicines="\n".join(f"- {name}" for name in names) or "- (none)"
+    )
+    response = _generate(client, [prompt, img], build_missing_fields_schema(fields), model, max_output_tokens=1024)
+
+    answer = repair_truncated_json(response.text or "")
+    if not answer:
+        return
+
+    by_name = {
+        str(med.get("medicine_name", "")).strip().upper(): med
+        for med in answer.get("medicines", []) if isinstance(med, dict)
+    }
+    for index, field in missing:
+        if index is None:
+            summary = validate_re_asked_value(field, answer.get("patient_summary"))
+            if summary:
+                result["patient_summary"] = summary
+            continue
+        med = result["structured_data"][index]
+        value = validate_re_asked_value(field, by_name.get(med["medicine_name"].strip().upper(), {}).get(field))
+        if value:
+            med[field] = value
+
+
+def _extract_from_image(img, model=DEFAULT_MODEL):
+    """Run the extraction prompt against an already loaded image."""
+    client = _get_client()
+
+    response = _generate(client, [PROMPT, img], RESPONSE_SCHEMA, model)
+    result, missing = parse_extraction(response.text or "")
+
+    missing = [(index, field) for index, field in missing if field in REASK_FIELDS]
+    if missing:
+        _reask_missing_fields(client, img, result, missing, model)
+
+    return result
+
+
+def _extract_routed(img, quality=None, load_image=None):
+    """
+    Extracts with the cheapest model tier the image is likely to need,
+    escalating to stronger tiers on low confidence or invalid output.
+
+    The returned result carries a "routing" entry describing the tiers
+    tried and their latency; the decision is also appended to the routing log.
+
+    Args:
+        img: PIL image, or an image Part already encoded for the model
+        quality: Precomputed assess_image_quality result, if any
+        load_image: Returns a PIL image for cropping when ``img`` is a Part
+    """
+    if quality is None:
+        quality = assess_image_quality(img)
+    start_tier = choose_start_tier(quality)
+
+    attempts = []
+    result = None
+    error = None
+    for tier in MODEL_TIERS[start_tier:]:
+        started = time.perf_counter()
+        refined = 0
+        refine_error = None
+        try:
+            candidate = _extract_from_image(img, tier["model"])
+            reason = escalation_reason(candidate)
+        except ValueError as e:
+            candidate, reason, error = None, "invalid_output", e
+
+        if candidate is not None and REFINE_BEFORE_ESCALATING and uncertain_medicines(candidate):
+            # Re-reading just the uncertain lines (low confidence or unclear
+            # dosage, frequency, duration, food) is much cheaper than a full
+            # extraction on a stronger tier
+            try:
+                source = load_image() if load_image else img
+                refined = refine_uncertain_medicines(_get_client(), source, candidate, _generate, tier["model"])
+            except Exception as e:
+                # Refinement is optional; keep the extraction that succeeded
+                refine_error = str(e)
+            if refined:
+                reason = escalation_reason(candidate)
+
+        attempt = {
+            "tier": tier["name"],
+            "model": tier["model"],
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "escalate_reason": reason,
+            "refined_medicines": refined
+        }
+        if refine_error:
+            attempt["refine_error"] = refine_error
+        attempts.append(attempt)
+
+        if candidate is not None:
+            result = candidate
+        if reason is None:
+            break
+
+    if result is None:
+        raise error
+
+    routing = {
+        "quality": quality,
+        "start_tier": MODEL_TIERS[start_tier]["name"],
+        "model": next(a["model"] for a in reversed(attempts) if a["escalate_reason"] != "invalid_output"),
+        "escalated": len(attempts) > 1,
+        "latency_ms": round(sum(a["latency_ms"] for a in attempts), 1),
+        "attempts": attempts
+    }
+    log_routing_decision(routing)
+    result["routing"] = routing
+    return result
+
+
+def extract_prescription(image_path):
+    """
+    Takes image path and returns structured JSON + summary.
+    """
+    with Image.open(image_path) as img:
+        return _extract_routed(img)
+
+
+def extract_prepared_image(prepared):
+    """
+    Extracts from a PreparedImage decoded by modules.image_pool.
+
+    The worker already re-encoded the image and measured its quality, so
+    this thread only sends the bytes and waits on the network.
+    """
+    part = types.Part.from_bytes(data=prepared.data(), mime_type="image/jpeg")
+    return _extract_routed(part, quality=prepared.quality, load_image=prepared.open)
+
+
+def confirm_same_medicines(image_path, medicine_names):
+    """
+    Cheap fast-tier check that a near-duplicate photo lists exactly the
+    same medicines as the earlier extraction, before that is reused.
+
+    Returns:
+        True only if every name is present and nothing else is written.
+    """
+    if not medicine_names:
+        return False
+    prompt = CONFIRM_PROMPT.format(medicines="\n".join(f"- {name}" for name in medicine_names))
+    with Image.open(image_path) as img:
+        response = _generate(_get_client(), [prompt, img], CONFIRM_SCHEMA, MODEL_TIERS[0]["model"],
+                             max_output_tokens=64)
+    answer = repair_truncated_json(response.text or "") or {}
+    return answer.get("all_listed_present") is True and answer.get("other_medicines") is False
+
+
+def iter_prescription_pages(paths, dpi=PDF_RENDER_DPI):
+    """
+    Lazily yields one PIL image per prescription page.
+
+    Args:
+        paths: A single path or a list of paths. Images count as one
+            page each, PDFs are rasterized one page at a time.
+        dpi: Resolution used when rendering PDF pages.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    for path in paths:
+        if str(path).lower().endswith(".pdf"):
+            try:
+                import pypdfium2 as pdfium
+            except ImportError:
+                raise ValueError("PDF support requires pypdfium2. Run: pip install pypdfium2")
+
+            pdf = pdfium.PdfDocument(path)
+            try:
+                for index in range(len(pdf)):
+                    page = pdf[index]
+                    try:
+                        img = page.render(scale=dpi / 72).to_pil()
+                    finally:
+                        page.close()
+                    yield img
+            finally:
+                pdf.close()
+        else:
+            with Image.open(path) as img:
+                img.load()
+                yield img
+
+
+def _known_value(value):
+    """Normalized field value, or "" when the model could not read it."""
+    value = re.sub(r"\s+", "", str(value or "").lower())
+    return "" if value == MISSING_VALUE else value
+
+
+def _same_medicine(existing, new):
+    """
+    True when two page entries are the same medicine: the names match and
+    the dosage and duration do not contradict each other. Unreadable
+    names never match, so distinct "unclear" medicines are all kept.
+    """
+    key = medicine_key(new.get("medicine_name", ""))
+    if not _known_value(key) or key != medicine_key(existing.get("medicine_name", "")):
+        return False
+    for field in ("dosage_pattern", "duration"):
+        current, value = _known_value(existing.get(field)), _known_value(new.get(field))
+        if current and value and current != value:
+            return False
+    return True
+
+
+def _merge_medicine(existing, new):
+    """
+    Fill fields that are unclear on one page with values from another.
+
+    Returns:
+        True if a field used in the patient summary changed.
+    """
+    changed = False
+    filled = False
+    for field, value in new.items():
+        if field == "confidence_note":
+            continue
+        if not _known_value(existing.get(field)) and _known_value(value):
+            existing[field] = value
+            filled = True
+            changed = changed or field in SUMMARY_FIELDS
+
+    # Values filled in from another page are only as reliable as that page's
+    # reading, so the lower confidence wins; otherwise the best reading does.
+    rank = {"high": 3, "medium": 2, "low": 1}
+    current = rank.get(existing.get("confidence_note", "").lower(), 0)
+    other = rank.get(new.get("confidence_note", "").lower(), 0)
+    if other and (other < current if filled else other > current):
+        existing["confidence_note"] = new["confidence_note"]
+    return changed
+
+
+def merge_page_results(page_results):
+    """
+    Merges per-page extraction results into a single result.
+
+    Medicines repeated across pages (a list continuing on the next sheet,
+    or the same photo taken twice) are collapsed into one entry, and the
+    patient summary is renumbered to match. A summary line is rebuilt
+    from the merged fields whenever another page filled one of them in.
+    """
+    entries = []
+    by_key = {}
+
+    for result in page_results:
+        # Pair this page's summary lines with its medicines, in order
+        page_lines = {}
+        for line in result.get("patient_summary", "").splitlines():
+            match = SUMMARY_LINE_PATTERN.match(line.strip())
+            if match:
+                page_lines.setdefault(medicine_key(match.group(1)), []).append(match.group(2).strip())
+
+        for med in result.get("structured_data", []):
+            key = medicine_key(med.get("medicine_name", ""))
+            lines = page_lines.get(key)
+            instruction = lines.pop(0) if lines else None
+
+            existing = next((entry for entry in by_key.get(key, []) if _same_medicine(entry["med"], med)), None)
+            if existing is None:
+                entry = {"med": dict(med), "instruction": instruction}
+                entries.append(entry)
+                by_key.setdefault(key, []).append(entry)
+            elif _merge_medicine(existing["med"], med):
+                existing["instruction"] = None
+
+    lines = ["You have been prescribed the following medicines:"]
+    for i, entry in enumerate(entries, 1):
+        med = entry["med"]
+        instruction = entry["instruction"]
+        if instruction is None:
+            instruction = (
+                f"{med.get('dosage_pattern', MISSING_VALUE)}, {med.get('food_instruction', MISSING_VALUE)}, "
+                f"{med.get('frequency', MISSING_VALUE)} for {med.get('duration', MISSING_VALUE)}."
+            )
+        lines.append(f"{i}. {med.get('medicine_name', '')}: {instruction}")
+
+    merged = {
+        "structured_data": [entry["med"] for entry in entries],
+        "patient_summary": "\n".join(lines)
+    }
+    if any(result.get("truncated") for result in page_results):
+        merged["truncated"] = True
+    return merged
+
+
+def extract_prescription_pages(paths, max_workers=MAX_PAGE_WORKERS):
+    """
+    Extracts a multi-page prescription (several photos and/or PDFs).
+
+    Pages are rendered lazily and at most ``max_workers`` of them are held
+    in memory at once, so memory use does not grow with page count.
+
+    Args:
+        paths: A single path or a list of image/PDF paths
+        max_workers: Number of pages extracted concurrently
+
+    Returns:
+        A merged result with deduplicated structured_data and summary,
+        plus the page count.
+    """
+    page_results = {}
+    pending = {}
+    page_count = 0
+
+    def _extract_and_close(img):
+        try:
+            return _extract_routed(img)
+        finally:
+            img.close()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page_number, img in enumerate(iter_prescription_pages(paths)):
+            page_count += 1
+            # Lazily opened images are closed by the generator; keep a copy for the worker.
+            pending[executor.submit(_extract_and_close, img.copy())] = page_number
+
+            if len(pending) >= max_workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page_results[pending.pop(future)] = future.result()
 
-    try:
-        parsed_json = json.loads(raw_text)
-    except json.JSONDecodeError:
-        # Fallback: extract outermost JSON object if model added extra text.
-        start = raw_text.find("{")
-        end = raw_text.rfind("}")
-        if start == -1 or end == -1 or end <= start:
-            raise ValueError("Model did not return valid JSON.")
-        parsed_json = json.loads(raw_text[start : end + 1])
+        for future in as_completed(pending):
+            page_results[pending[future]] = future.result()
 
-    return parsed_json
+    if not page_count:
+        raise ValueError("No pages found in the given input.")
 
+    ordered = [page_results[i] for i in sorted(page_results)]
+    merged = merge_page_results(ordered)
+    merged["page_count"] = page_count
+    merged["routing"] = combine_routing([r["routing"] for r in ordered])
+    return merged
@@ -1,14 +1,37 @@
+import gzip
 import json
 import os
 import shutil
-from datetime import datetime
-import matplotlib.pyplot as plt
-from tabulate import tabulate
+import threading
+import zipfile
+from datetime import datetime, timedelta
+from itertools import islice
+from modules.lexicon import normalize_medicine_name
+from modules.dedup import get_dedup_statistics, prune_index
+from modules.routing import get_routing_statistics
+from modules.tables import format_grid
 
+# Single-file history used before monthly shards. Reads include its records
+# as they are; the first write migrates it into shards.
 HISTORY_FILE = "prescription_history.json"
+HISTORY_FOLDER = "history"
 AUDIO_FOLDER = "audio_files"
+AUDIO_ARCHIVE_FOLDER = os.path.join(AUDIO_FOLDER, "archive")
 CHART_FOLDER = "charts"
 
+HISTORY_RETENTION_MONTHS = int(os.getenv("HISTORY_RETENTION_MONTHS", "24"))
+AUDIO_ARCHIVE_DAYS = int(os.getenv("AUDIO_ARCHIVE_DAYS", "90"))
+
+# Background post-processing also writes to shards
+_shard_lock = threading.Lock()
+
+# Parsed legacy history, keyed by the file's (size, mtime)
+_legacy_cache = None
+
+# Last time handed out as a prescription id, so concurrent saves never share one
+_id_lock = threading.Lock()
+_last_id_time = None
+
 
 def ensure_folders():
     """Create necessary folders if they don't exist."""
@@ -16,24 +39,265 @@ def ensure_folders():
         os.makedirs(AUDIO_FOLDER)
     if not os.path.exists(CHART_FOLDER):
         os.makedirs(CHART_FOLDER)
+    if not os.path.exists(HISTORY_FOLDER):
+        os.makedirs(HISTORY_FOLDER)
 
 
-def load_history():
-    """Load prescription history from JSON file."""
-    ensure_folders()
-    if os.path.exists(HISTORY_FILE):
+def _month_of(prescription_id):
+    """Shard key ("YYYY-MM") for a prescription id like 20260227_224637_123456."""
+    return f"{prescription_id[:4]}-{prescription_id[4:6]}"
+
+
+def _new_prescription_id():
+    """
+    Unique id for a new prescription, e.g. 20260227_224637_123456.
+
+    Ids carry microseconds and are strictly increasing within the process,
+    so saves landing in the same microsecond (batch --workers) still get
+    distinct ids and audio files. Older records keep their 20260227_224637 ids.
+
+    Returns:
+        Tuple of (prescription_id, created_at datetime).
+    """
+    global _last_id_time
+    with _id_lock:
+        now = datetime.now()
+        if _last_id_time is not None and now <= _last_id_time:
+            now = _last_id_time + timedelta(microseconds=1)
+        _last_id_time = now
+    return now.strftime("%Y%m%d_%H%M%S_%f"), now
+
+
+def _current_month():
+    return datetime.now().strftime("%Y-%m")
+
+
+def _shard_path(month, compacted=False):
+    return os.path.join(HISTORY_FOLDER, f"{month}.json.gz" if compacted else f"{month}.json")
+
+
+def _legacy_months():
+    """Records of the not-yet-migrated legacy history file, grouped by month."""
+    global _legacy_cache
+
+    if not os.path.exists(HISTORY_FILE):
+        return {}
+    stat = os.stat(HISTORY_FILE)
+    key = (stat.st_size, stat.st_mtime_ns)
+    if _legacy_cache is None or _legacy_cache[0] != key:
         with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+        months = {}
+        for rx in history.get("prescriptions", []):
+            months.setdefault(_month_of(rx['id']), []).append(rx)
+        _legacy_cache = (key, months)
+    return _legacy_cache[1]
+
+
+def list_shards():
+    """Return the months that have history, oldest first."""
+    months = set(_legacy_months())
+    if os.path.exists(HISTORY_FOLDER):
+        for file in os.listdir(HISTORY_FOLDER):
+            if file.endswith(".json") or file.endswith(".json.gz"):
+                months.add(file.split(".")[0])
+    return sorted(months)
+
+
+def _read_shard_file(month):
+    path = _shard_path(month)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    path = _shard_path(month, compacted=True)
+    if os.path.exists(path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
             return json.load(f)
+
     return {"prescriptions": []}
 
 
+def load_shard(month):
+    """Load one month of history, whether open (.json) or compacted (.json.gz)."""
+    shard = _read_shard_file(month)
+
+    # Writers migrate first, so this only adds records on read-only paths
+    legacy = _legacy_months().get(month)
+    if legacy:
+        shard["prescriptions"] = legacy + shard["prescriptions"]
+    return shard
+
+
+def save_shard(month, shard):
+    """Write an open (uncompacted) monthly shard."""
+    path = _shard_path(month)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(shard, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+    # A closed month reopened for writing is no longer compacted
+    compacted = _shard_path(month, compacted=True)
+    if os.path.exists(compacted):
+        os.remove(compacted)
+
+
+def _migrate_legacy_history():
+    """
+    Split the old single-file history into monthly shards. Only called
+    from write paths, so viewing history never renames the user's file.
+    """
+    global _legacy_cache
+
+    with _shard_lock:
+        if not os.path.exists(HISTORY_FILE):
+            return
+        for month, prescriptions in _legacy_months().items():
+            shard = _read_shard_file(month)
+            known = {rx['id'] for rx in shard["prescriptions"]}
+            shard["prescriptions"] = [rx for rx in prescriptions if rx['id'] not in known] + shard["prescriptions"]
+            save_shard(month, shard)
+        os.replace(HISTORY_FILE, HISTORY_FILE + ".migrated")
+        _legacy_cache = None
+
+
+def iter_history(newest_first=False):
+    """Yield prescription records shard by shard, without loading them all at once."""
+    ensure_folders()
+    months = list_shards()
+    if newest_first:
+        months.reverse()
+    for month in months:
+        prescriptions = load_shard(month).get("prescriptions", [])
+        if newest_first:
+            prescriptions = reversed(prescriptions)
+        yield from prescriptions
+
+
+def load_history():
+    """Load prescription history from all monthly shards."""
+    return {"prescriptions": list(iter_history())}
+
+
 def save_history(history):
-    """Save prescription history to JSON file."""
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(history, f, indent=2, ensure_ascii=False)
+    """Save prescription history, writing each record to its monthly shard."""
+    shards = {}
+    for rx in history.get("prescriptions", []):
+        shards.setdefault(_month_of(rx['id']), []).append(rx)
+    for month, prescriptions in shards.items():
+        save_shard(month, {"prescriptions": prescriptions})
 
 
-def add_prescription_to_history(image_path, language, medicines_data, audio_filename):
+def compact_history(retention_months=HISTORY_RETENTION_MONTHS):
+    """
+    Apply the retention policy and compact closed months.
+
+    Shards older than ``retention_months`` are deleted. Every other month
+    before the current one is rewritten as compact, gzipped JSON.
+
+    Returns:
+        Dict with the months that were compacted and deleted.
+    """
+    ensure_folders()
+    _migrate_legacy_history()
+    now = datetime.now()
+    oldest_kept = now.year * 12 + now.month - 1 - retention_months
+    current = _current_month()
+
+    compacted = []
+    deleted = []
+    for month in list_shards():
+        year, month_number = (int(part) for part in month.split("-"))
+        if year * 12 + month_number - 1 < oldest_kept:
+            for path in (_shard_path(month), _shard_path(month, compacted=True)):
+                if os.path.exists(path):
+                    os.remove(path)
+            deleted.append(month)
+            continue
+
+        if month == current or not os.path.exists(_shard_path(month)):
+            continue
+
+        shard = load_shard(month)
+        with gzip.open(_shard_path(month, compacted=True), 'wt', encoding='utf-8') as f:
+            json.dump(shard, f, separators=(",", ":"), ensure_ascii=False)
+        os.remove(_shard_path(month))
+        compacted.append(month)
+
+    if deleted:
+        # Photos of deleted prescriptions must not be reused
+        prune_index(set(list_shards()))
+
+    return {"compacted": compacted, "deleted": deleted}
+
+
+def archive_old_audio(days=AUDIO_ARCHIVE_DAYS):
+    """
+    Move audio files older than ``days`` into monthly zip bundles under
+    the archive folder. Archived files can be restored with
+    extract_archived_audio.
+
+    Returns:
+        Number of files archived.
+    """
+    ensure_folders()
+    os.makedirs(AUDIO_ARCHIVE_FOLDER, exist_ok=True)
+    cutoff = datetime.now().timestamp() - days * 86400
+
+    archived = 0
+    for file in sorted(os.listdir(AUDIO_FOLDER)):
+        path = os.path.join(AUDIO_FOLDER, file)
+        if not os.path.isfile(path) or os.path.getmtime(path) >= cutoff:
+            continue
+
+        month = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m")
+        bundle = os.path.join(AUDIO_ARCHIVE_FOLDER, f"{month}.zip")
+        with zipfile.ZipFile(bundle, 'a', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+            if file not in zf.namelist():
+                zf.write(path, arcname=file)
+        os.remove(path)
+        archived += 1
+
+    return archived
+
+
+def list_archived_audio():
+    """List audio files stored in archive bundles."""
+    if not os.path.exists(AUDIO_ARCHIVE_FOLDER):
+        return []
+
+    archived = []
+    for bundle in sorted(os.listdir(AUDIO_ARCHIVE_FOLDER)):
+        if not bundle.endswith(".zip"):
+            continue
+        bundle_path = os.path.join(AUDIO_ARCHIVE_FOLDER, bundle)
+        with zipfile.ZipFile(bundle_path) as zf:
+            for info in zf.infolist():
+                archived.append({
+                    'filename': info.filename,
+                    'path': bundle_path,
+                    'size_kb': round(info.file_size / 1024, 2),
+                    'archived': True
+                })
+    return archived
+
+
+def extract_archived_audio(filename):
+    """
+    Restore an archived audio file into the audio folder.
+
+    Returns:
+        The restored file path, or None if it is not in any bundle.
+    """
+    for audio in list_archived_audio():
+        if audio['filename'] == filename:
+            with zipfile.ZipFile(audio['path']) as zf:
+                return zf.extract(filename, AUDIO_FOLDER)
+    return None
+
+
+def add_prescription_to_history(image_path, language, medicines_data, audio_filename, routing=None):
     """
     Add a new prescription to history.
     
@@ -42,10 +306,10 @@ def add_prescription_to_history(image_path, language, medicines_data, audio_file
         language: Language of translation
         medicines_data: List of medicine dictionaries
         audio_filename: Path to the generated audio file
+        routing: Optional model routing info from the extractor
     """
     ensure_folders()
-    
-    history = load_history()
+    _migrate_legacy_history()
     
     # Calculate average confidence
     confidences = []
@@ -60,16 +324,19 @@ def add_prescription_to_history(image_path, language, medicines_data, audio_file
     avg_confidence = sum(confidences) / len(confidences) if confidences else 0
     
     # Move audio file to organized folder
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    organized_audio_path = os.path.join(AUDIO_FOLDER, f"{timestamp}_{language}.mp3")
+    prescription_id, created_at = _new_prescription_id()
+    organized_audio_path = os.path.join(AUDIO_FOLDER, f"{prescription_id}_{language}.mp3")
     
     if os.path.exists(audio_filename):
         shutil.copy(audio_filename, organized_audio_path)
     
+    # Normalize names so the same drug groups together across spellings
+    normalized = [normalize_medicine_name(med['medicine_name']) for med in medicines_data]
+    
     # Create prescription record
     prescription_record = {
-        "id": timestamp,
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "id": prescription_id,
+        "date": created_at.strftime("%Y-%m-%d %H:%M:%S"),
         "image_file": os.path.basename(image_path),
         "language": language,
         "medicine_count": len(medicines_data),
@@ -79,25 +346,66 @@ def add_prescription_to_history(image_path, language, medicines_data, audio_file
                 "dosage": med['dosage_pattern'],
                 "frequency": med['frequency'],
                 "duration": med['duration'],
-                "confidence": med['confidence_note']
+                "food": med['food_instruction'],
+                "confidence": med['confidence_note'],
+                "canonical_name": norm['canonical_name'],
+                "form": norm['form'],
+                "strength": norm['strength'],
+                "lexicon_match": norm['match_score']
             }
-            for med in medicines_data
+            for med, norm in zip(medicines_data, normalized)
         ],
         "accuracy_score": round(avg_confidence, 2),
         "audio_file": organized_audio_path,
         "audio_available": os.path.exists(organized_audio_path)
     }
     
-    history["prescriptions"].append(prescription_record)
-    save_history(history)
+    if routing:
+        prescription_record["routing"] = {
+            "model": routing["model"],
+            "escalated": routing["escalated"],
+            "latency_ms": routing["latency_ms"]
+        }
+    
+    # Only the current month's shard is read and rewritten
+    month = _month_of(prescription_id)
+    with _shard_lock:
+        shard = load_shard(month)
+        shard["prescriptions"].append(prescription_record)
+        save_shard(month, shard)
+    
+    # Keep the dose reminder index up to date (numpy is only needed here)
+    from modules.schedule import add_record_to_schedule
+    add_record_to_schedule(prescription_record)
     
     return prescription_record
 
 
+def update_prescription_record(prescription_id, fields):
+    """
+    Update fields of an existing prescription record in place.
+    
+    Returns:
+        The updated record, or None if the prescription is not found.
+    """
+    ensure_folders()
+    _migrate_legacy_history()
+    month = _month_of(prescription_id)
+    with _shard_lock:
+        shard = load_shard(month)
+        for rx in shard["prescriptions"]:
+            if rx['id'] == prescription_id:
+                rx.update(fields)
+                save_shard(month, shard)
+                return rx
+    return None
+
+
 def display_history():
     """Display prescription history in a formatted table."""
-    history = load_history()
-    prescriptions = history.get("prescriptions", [])
+    
+    # Newest shards first, stopping once the last 10 are found
+    prescriptions = list(islice(iter_history(newest_first=True), 10))[::-1]
     
     if not prescriptions:
         print("\n" + "="*80)
@@ -112,7 +420,7 @@ def display_history():
     
     # Prepare table data
     table_data = []
-    for i, rx in enumerate(prescriptions[-10:], 1):  # Show last 10
+    for i, rx in enumerate(prescriptions, 1):
         table_data.append([
             i,
             rx['id'],
@@ -124,14 +432,15 @@ def display_history():
         ])
     
     headers = ["#", "ID", "Date", "Language", "Medicines", "Accuracy", "Audio"]
-    print(tabulate(table_data, headers=headers, tablefmt="grid"))
+    print(format_grid(table_data, headers))
     print()
 
 
 def show_prescription_details(prescription_id):
     """Show detailed information about a specific prescription."""
-    history = load_history()
-    prescriptions = history.get("prescriptions", [])
+    # The id encodes the month, so only that shard needs reading
+    ensure_folders()
+    prescriptions = load_shard(_month_of(prescription_id)).get("prescriptions", [])
     
     for rx in prescriptions:
         if rx['id'] == prescription_id:
@@ -145,6 +454,12 @@ def show_prescription_details(prescription_id):
             print(f"Accuracy Score: {rx['accuracy_score']}%")
             print(f"Audio File: {rx['audio_file']}")
             print(f"Audio Available: {'Yes' if rx['audio_available'] else 'No'}")
+            for profile, audio in rx.get('audio_profiles', {}).items():
+                if 'error' in audio:
+                    print(f"  {profile}: failed ({audio['error']})")
+                else:
+                    print(f"  {profile}: {audio['path']} - {audio['size_bytes'] / 1024:.1f} KB, "
+                          f"{audio['duration_sec'] or '?'} s")
             
             print(f"\n{'─'*80}")
             print("MEDICINES:")
@@ -153,7 +468,12 @@ def show_prescription_details(prescription_id):
             for i, med in enumerate(rx['medicines'], 1):
                 print(f"{i}. {med['name']}")
                 print(f"   Dosage: {med['dosage']} | Frequency: {med['frequency']} | Duration: {med['duration']}")
-                print(f"   Confidence: {med['confidence']}\n")
+                print(f"   Confidence: {med['confidence']}")
+                if 'canonical_name' in med and not med['canonical_name']:
+                    print("   ⚠️  Not found in medicine lexicon - please verify the name")
+                elif med.get('lexicon_match', 1.0) < 1.0:
+                    print(f"   ⚠️  Closest lexicon match: {med['canonical_name']} - please verify the name")
+                print()
             
             print(f"{'='*80}\n")
             return
@@ -163,6 +483,11 @@ def show_prescription_details(prescription_id):
 
 def generate_accuracy_chart():
     """Generate accuracy chart from prescription history."""
+    # matplotlib is slow to import, so only the chart command pays for it
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    
     ensure_folders()
     history = load_history()
     prescriptions = history.get("prescriptions", [])
@@ -172,7 +497,7 @@ def generate_accuracy_chart():
         return None
     
     # Prepare data
-    ids = [p['id'][-8:] for p in prescriptions[-15:]]  # Last 15, show last 8 chars of ID
+    ids = [p['id'][:15][-8:] for p in prescriptions[-15:]]  # Last 15, show last 8 chars of the date and time
     accuracy_scores = [p['accuracy_score'] for p in prescriptions[-15:]]
     
     # Create figure with two subplots
@@ -227,7 +552,7 @@ def list_downloadable_audio():
     audio_files = []
     if os.path.exists(AUDIO_FOLDER):
         for file in os.listdir(AUDIO_FOLDER):
-            if file.endswith('.mp3'):
+            if file.endswith(('.mp3', '.ogg')):
                 filepath = os.path.join(AUDIO_FOLDER, file)
                 size_kb = os.path.getsize(filepath) / 1024
                 audio_files.append({
@@ -236,11 +561,15 @@ def list_downloadable_audio():
                     'size_kb': round(size_kb, 2)
                 })
     
+    # Restored files are listed once, from the audio folder
+    on_disk = {audio['filename'] for audio in audio_files}
+    audio_files.extend(a for a in list_archived_audio() if a['filename'] not in on_disk)
     return audio_files
 
 
 def display_downloadable_files():
     """Display all downloadable audio files."""
+    
     audio_files = list_downloadable_audio()
     
     if not audio_files:
@@ -257,12 +586,46 @@ def display_downloadable_files():
             i,
             audio['filename'],
             f"{audio['size_kb']} KB",
-            audio['path']
+            f"{audio['path']} (archived)" if audio.get('archived') else audio['path']
         ])
     
     headers = ["#", "Filename", "Size", "Path"]
-    print(tabulate(table_data, headers=headers, tablefmt="grid"))
-    print(f"\nTotal files: {len(audio_files)}\n")
+    print(format_grid(table_data, headers))
+    print(f"\nTotal files: {len(audio_files)}")
+    if any(audio.get('archived') for audio in audio_files):
+        print("Restore archived files with: python app.py restore-audio <filename>")
+    print()
+
+
+def rebuild_dose_schedule():
+    """Rebuild the dose reminder index from all history shards."""
+    from modules.schedule import rebuild_schedule
+    return rebuild_schedule(iter_history())
+
+
+def display_due_doses(hours=1):
+    """Display every dose due in the next ``hours`` across all patients."""
+    from modules.schedule import describe_due_doses
+    
+    ensure_folders()
+    now = datetime.now().replace(second=0, microsecond=0)
+    doses = describe_due_doses(now, now + timedelta(hours=hours), load_shard)
+    
+    print(f"\n{'='*80}")
+    print(f"⏰ DOSES DUE IN THE NEXT {hours} HOUR(S)")
+    print(f"{'='*80}\n")
+    
+    if not doses:
+        print("No doses due.\n")
+        return
+    
+    table_data = [
+        [d['time'], d['prescription_id'], d['medicine'], d['slot'], d['quantity'], d['food']]
+        for d in doses
+    ]
+    headers = ["Time", "Prescription", "Medicine", "Slot", "Qty", "Food"]
+    print(format_grid(table_data, headers))
+    print(f"\nTotal doses: {len(doses)}\n")
 
 
 def get_history_statistics():
@@ -278,12 +641,25 @@ def get_history_statistics():
     avg_accuracy = sum(p['accuracy_score'] for p in prescriptions) / total_prescriptions
     languages_used = set(p['language'] for p in prescriptions)
     
+    # Group medicines by canonical name (older records fall back to the raw name)
+    medicine_counts = {}
+    unmatched = 0
+    for p in prescriptions:
+        for med in p['medicines']:
+            name = med.get('canonical_name') or med['name']
+            medicine_counts[name] = medicine_counts.get(name, 0) + 1
+            if 'canonical_name' in med and not med['canonical_name']:
+                unmatched += 1
+    top_medicines = sorted(medicine_counts.items(), key=lambda item: item[1], reverse=True)[:5]
+    
     return {
         "total_prescriptions": total_prescriptions,
         "total_medicines": total_medicines,
         "average_accuracy": round(avg_accuracy, 2),
         "languages_used": list(languages_used),
-        "audio_files": sum(1 for p in prescriptions if p['audio_available'])
+        "audio_files": sum(1 for p in prescriptions if p['audio_available']),
+        "top_medicines": top_medicines,
+        "unmatched_medicines": unmatched
     }
 
 
@@ -303,4 +679,21 @@ def display_statistics():
     print(f"Average Accuracy: {stats['average_accuracy']}%")
     print(f"Languages Used: {', '.join(stats['languages_used'])}")
     print(f"Audio Files: {stats['audio_files']}")
+    print(f"Most Prescribed: {', '.join(f'{name} ({count})' for name, count in stats['top_medicines'])}")
+    print(f"Medicines Not In Lexicon: {stats['unmatched_medicines']}")
+    
+    routing_stats = get_routing_statistics()
+    if routing_stats:
+        print(f"\nModel Routing ({routing_stats['decisions']} extractions, "
+              f"{routing_stats['escalation_rate']}% escalated):")
+        for tier, tier_stats in routing_stats['tiers'].items():
+            print(f"  {tier}: {tier_stats['calls']} calls, "
+                  f"avg {tier_stats['avg_latency_ms']} ms, "
+                  f"{tier_stats['escalation_rate']}% escalated")
+    
+    dedup_stats = get_dedup_statistics()
+    if dedup_stats:
+        print(f"\nNear-Duplicate Photos: {dedup_stats['hits']} of {dedup_stats['lookups']} lookups "
+              f"({dedup_stats['hit_rate']}%) reused an earlier extraction, "
+              f"{dedup_stats['indexed_images']} images indexed")
     print(f"\n{'='*80}\n")
@@ -0,0 +1,110 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+# Longest side sent to the model; larger phone photos are downscaled
+MAX_IMAGE_SIDE = 2048
+JPEG_QUALITY = 90
+
+
+class PreparedImage:
+    """
+    A prescription image decoded, resized and re-encoded as JPEG by a
+    worker process. The JPEG bytes live in a shared memory block, so only
+    this small handle is pickled back to the parent.
+    """
+
+    def __init__(self, path, shm_name, nbytes, size, quality):
+        self.path = path
+        self.shm_name = shm_name
+        self.nbytes = nbytes
+        self.size = size
+        self.quality = quality
+        self._shm = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_shm"] = None
+        return state
+
+    def view(self):
+        """Zero-copy view of the JPEG bytes."""
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.shm_name)
+        return self._shm.buf[:self.nbytes]
+
+    def data(self):
+        """The JPEG bytes (one copy, for clients that need ``bytes``)."""
+        return bytes(self.view())
+
+    def open(self):
+        """Decode into a PIL image (only needed for cropping, which is rare)."""
+        from PIL import Image
+        img = Image.open(io.BytesIO(self.view()))
+        img.load()
+        return img
+
+    def release(self):
+        """Free the shared memory block."""
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.shm_name)
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+
+def prepare_image(path, max_side=MAX_IMAGE_SIDE, jpeg_quality=JPEG_QUALITY):
+    """
+    Decode, orient, downscale and re-encode one image into shared memory.
+    Runs in a worker process; also computes the routing quality metrics
+    there, since they are CPU-bound too.
+    """
+    from PIL import Image, ImageOps
+    from modules.routing import assess_image_quality
+
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    quality = assess_image_quality(img)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=jpeg_quality)
+    encoded = buffer.getbuffer()
+
+    shm = shared_memory.SharedMemory(create=True, size=len(encoded))
+    shm.buf[:len(encoded)] = encoded
+    name = shm.name
+    shm.close()
+    # The parent owns the block from here on and unlinks it in release()
+    resource_tracker.unregister(shm._name, "shared_memory")
+
+    return PreparedImage(path, name, len(encoded), img.size, quality)
+
+
+class ImageDecodePool:
+    """
+    Process pool for CPU-bound image work, so decoding large JPEGs does not
+    block the threads waiting on network calls.
+
+    Use as a context manager; ``submit(path)`` returns a Future that
+    resolves to a PreparedImage. Call release() on each one when done.
+    """
+
+    def __init__(self, workers=None, max_side=MAX_IMAGE_SIDE, jpeg_quality=JPEG_QUALITY):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def submit(self, path):
+        return self._executor.submit(prepare_image, path, self.max_side, self.jpeg_quality)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+DEFAULT_JOURNAL_FILE = "batch_journal.jsonl"
+BATCH_AUDIO_FOLDER = "batch_audio"
+
+INPUT_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".pdf")
+
+
+def collect_inputs(paths):
+    """Expand directories into their prescription images/PDFs, sorted."""
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            inputs.extend(
+                os.path.join(path, file) for file in sorted(os.listdir(path))
+                if file.lower().endswith(INPUT_EXTENSIONS)
+            )
+        else:
+            inputs.append(path)
+    return inputs
+
+
+def load_journal(journal_path):
+    """
+    Read the completed stages from a job journal.
+
+    Returns:
+        Dict mapping input path -> {stage: data}. A line cut short by a
+        crash mid-write is ignored; that stage simply runs again.
+    """
+    completed = {}
+    if not os.path.exists(journal_path):
+        return completed
+
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            completed.setdefault(entry["input"], {})[entry["stage"]] = entry.get("data")
+    return completed
+
+
+def append_journal(journal, input_path, stage, data=None):
+    """Durably record one completed stage: a single appended line, fsync'd."""
+    entry = {
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "input": input_path,
+        "stage": stage,
+        "data": data
+    }
+    journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def default_backends():
+    """The real pipeline stages; imported only when a batch actually runs."""
+    from modules.extractor import extract_prepared_image, extract_prescription, extract_prescription_pages
+    from modules.translate import translate_summary
+    from modules.voice import generate_voice_output
+    from modules.history import add_prescription_to_history
+
+    def extract(input_path):
+        if input_path.lower().endswith(".pdf"):
+            return extract_prescription_pages([input_path])
+        return extract_prescription(input_path)
+
+    return {
+        "extract": extract,
+        "extract_prepared": extract_prepared_image,
+        "translate": translate_summary,
+        "voice": generate_voice_output,
+        "save": add_prescription_to_history
+    }
+
+
+def _audio_base(input_path):
+    """
+    Audio file stem unique per input path, so a/rx.jpeg and b/rx.jpeg (or
+    rx.pdf and rx.jpg) never share a file; stable across resumed runs.
+    """
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    digest = hashlib.sha1(os.path.abspath(input_path).encode("utf-8")).hexdigest()[:8]
+    return f"{stem}_{digest}"
+
+
+def process_input(input_path, languages, done, record, backends, audio_folder=BATCH_AUDIO_FOLDER,
+                  prepared=None):
+    """
+    Run the pipeline for one input, skipping stages already in ``done``.
+
+    Stages are "extracted", then per language "translated:<lang>",
+    "voiced:<lang>" and "saved:<lang>". ``record(stage, data)`` is called
+    after each stage completes. ``prepared`` is an optional Future for the
+    image already decoded by an ImageDecodePool.
+    """
+    result = done.get("extracted")
+    if result is None:
+        if prepared is not None:
+            image = prepared.result()
+            try:
+                result = backends["extract_prepared"](image)
+            finally:
+                image.release()
+        else:
+            result = backends["extract"](input_path)
+        record("extracted", result)
+
+    base = _audio_base(input_path)
+    for language in languages:
+        translated = done.get(f"translated:{language}")
+        if translated is None:
+            translated = backends["translate"](result.get("patient_summary", ""), language)
+            record(f"translated:{language}", translated)
+
+        audio_path = done.get(f"voiced:{language}")
+        if audio_path is None or not os.path.exists(audio_path):
+            os.makedirs(audio_folder, exist_ok=True)
+            audio_path = backends["voice"](translated, language, os.path.join(audio_folder, f"{base}_{language}.mp3"))
+            record(f"voiced:{language}", audio_path)
+
+        if f"saved:{language}" not in done:
+            prescription_record = backends["save"](
+                input_path, language, result["structured_data"], audio_path,
+                routing=result.get("routing")
+            )
+            record(f"saved:{language}", prescription_record["id"])
+
+
+def _needs_decode(input_path, done):
+    return "extracted" not in done and not input_path.lower().endswith(".pdf")
+
+
+def run_batch(paths, languages, journal_path=DEFAULT_JOURNAL_FILE, backends=None,
+              workers=1, decode_workers=0):
+    """
+    Process many prescriptions, resumably.
+
+    Every completed stage is appended to the journal, so re-running the
+    same job after a crash or quota error skips finished inputs and
+    resumes unfinished ones mid-pipeline.
+
+    Args:
+        workers: Threads running the network-bound stages concurrently
+        decode_workers: Processes decoding images ahead of the network
+            stages (0 decodes on the network thread, as before)
+
+    Returns:
+        Dict with counts of completed, skipped and failed inputs.
+    """
+    if backends is None:
+        backends = default_backends()
+
+    inputs = collect_inputs(paths)
+    journal_state = load_journal(journal_path)
+    final_stages = [f"saved:{language}" for language in languages]
+
+    def is_finished(input_path):
+        done = journal_state.get(input_path, {})
+        return all(stage in done for stage in final_stages)
+
+    pending = [p for p in inputs if not is_finished(p)]
+    skipped = len(inputs) - len(pending)
+
+    print(f"\n{'='*80}")
+    print(f"📦 BATCH JOB: {len(inputs)} inputs, {len(languages)} language(s)")
+    print(f"{'='*80}\n")
+    if skipped:
+        print(f"⏭️  Resuming: {skipped} input(s) already finished in {journal_path}\n")
+
+    decode_pool = None
+    if decode_workers and "extract_prepared" in backends:
+        from modules.image_pool import ImageDecodePool
+        decode_pool = ImageDecodePool(decode_workers)
+        print(f"🖼️  Decoding images in {decode_pool.workers} process(es)\n")
+
+    completed = 0
+    failed = []
+    position = 0
+    journal_lock = threading.Lock()
+    started = time.perf_counter()
+
+    if workers > 1:
+        # History and schedule writes stay one at a time; only the
+        # network-bound stages overlap
+        save_lock = threading.Lock()
+        save = backends["save"]
+
+        def locked_save(*args, **kwargs):
+            with save_lock:
+                return save(*args, **kwargs)
+
+        backends = dict(backends, save=locked_save)
+
+    def run_one(input_path, prepared):
+        done = journal_state.setdefault(input_path, {})
+
+        def record(stage, data):
+            with journal_lock:
+                append_journal(journal, input_path, stage, data)
+                done[stage] = data
+
+        process_input(input_path, languages, done, record, backends, prepared=prepared)
+
+    def report(input_path, future):
+        nonlocal completed, position
+        position += 1
+        try:
+            future.result()
+            completed += 1
+            status = "✓"
+            if (journal_state[input_path].get("extracted") or {}).get("truncated"):
+                status += " ⚠️  output cut off, medicines may be missing"
+        except Exception as e:
+            failed.append((input_path, str(e)))
+            status = f"✗ {e}"
+
+        elapsed = time.perf_counter() - started
+        per_item = elapsed / position
+        eta = per_item * (len(pending) - position)
+        overall = skipped + position
+        print(f"[{overall}/{len(inputs)}] {os.path.basename(input_path)} {status}  "
+              f"({100 * overall / len(inputs):.0f}%, {per_item:.1f}s/item, ETA {_format_duration(eta)})")
+
+    # Keep a bounded number of inputs in flight, so decoded images waiting
+    # for the network don't pile up in shared memory
+    max_in_flight = workers + (decode_pool.workers if decode_pool else 0)
+    try:
+        with open(journal_path, 'a', encoding='utf-8') as journal, \
+                ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = {}
+            for input_path in pending:
+                if len(in_flight) >= max_in_flight:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        report(in_flight.pop(future), future)
+
+                prepared = None
+                if decode_pool and _needs_decode(input_path, journal_state.get(input_path, {})):
+                    prepared = decode_pool.submit(input_path)
+                in_flight[executor.submit(run_one, input_path, prepared)] = input_path
+
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    report(in_flight.pop(future), future)
+    finally:
+        if decode_pool:
+            decode_pool.close()
+
+    print(f"\n✅ Completed: {completed}  ⏭️  Skipped: {skipped}  ❌ Failed: {len(failed)}")
+    if failed:
+        print("Re-run the same command to retry failed inputs from where they stopped.")
+    print()
+
+    return {"completed": completed, "skipped": skipped, "failed": failed}
@@ -0,0 +1,374 @@
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+from array import array
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+LEXICON_FILE = os.path.join(DATA_FOLDER, "medicine_lexicon.txt")
+
+# Minimum trigram similarity (Dice coefficient) for a fuzzy match.
+FUZZY_MATCH_THRESHOLD = 0.5
+
+# Trigrams shared by more than this fraction of entries (e.g. the leading
+# "  S") say little about a match, so their posting lists are not scanned.
+# The floor keeps small lexicons exact: brand families such as TELMA /
+# TELMA AM / TELMA H share every trigram of the base name.
+COMMON_GRAM_FRACTION = 0.02
+COMMON_GRAM_MIN = 64
+# Candidates re-scored exactly after the posting-list count
+FUZZY_CANDIDATES = 20
+
+# Persisted trigram index, stored next to the lexicon and memory mapped:
+# header, gram offsets (uint64), postings (uint32), per-entry trigram
+# counts (uint8), then the sorted trigrams as 12-byte UTF-8 keys.
+INDEX_SUFFIX = ".trigrams"
+INDEX_MAGIC = b"LEXTRI01"
+INDEX_HEADER = struct.Struct("<8sQQQQQ")
+GRAM_KEY_BYTES = 12
+
+_lexicon = None
+
+FORM_NAMES = {
+    "TAB": "Tablet",
+    "TABS": "Tablet",
+    "TABLET": "Tablet",
+    "CAP": "Capsule",
+    "CAPS": "Capsule",
+    "CAPSULE": "Capsule",
+    "SYP": "Syrup",
+    "SYR": "Syrup",
+    "SYRUP": "Syrup",
+    "SUSP": "Suspension",
+    "GEL": "Gel",
+    "INJ": "Injection",
+    "OINT": "Ointment",
+    "OINTMENT": "Ointment",
+    "CRM": "Cream",
+    "CREAM": "Cream",
+    "LOTION": "Lotion",
+    "DROPS": "Drops",
+    "DRP": "Drops",
+    "INH": "Inhaler",
+    "SACHET": "Sachet",
+    "POWDER": "Powder",
+}
+
+UNIT_NAMES = {
+    "MG": "mg",
+    "MCG": "mcg",
+    "G": "g",
+    "GM": "g",
+    "ML": "ml",
+    "IU": "IU",
+    "K": "K",
+    "%": "%",
+}
+
+FORM_PATTERN = re.compile(r"^(%s)\b\.?\s*" % "|".join(sorted(FORM_NAMES, key=len, reverse=True)))
+TRAILING_FORM_PATTERN = re.compile(r"\s+(%s)\.?$" % "|".join(sorted(FORM_NAMES, key=len, reverse=True)))
+STRENGTH_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(MCG|MG|GM|G|ML|IU|K|%)(?![A-Z])")
+# A strength written without its unit, as in "TELMA 40"
+BARE_STRENGTH_PATTERN = re.compile(r"(?<=\S)\s+(\d+(?:\.\d+)?)$")
+
+
+def split_medicine_name(raw_name):
+    """
+    Splits a raw extracted name such as "TAB. SOMPRAZ 40MG" into
+    form, name and strength.
+
+    Returns:
+        Tuple of (form, name, strength); form and strength may be None.
+    """
+    text = " ".join(raw_name.upper().split())
+
+    form = None
+    match = FORM_PATTERN.match(text)
+    if match:
+        form = FORM_NAMES[match.group(1)]
+        text = text[match.end():]
+
+    # "SYP. DOLCID SYP" repeats the form after the name
+    match = TRAILING_FORM_PATTERN.search(text)
+    if match:
+        form = form or FORM_NAMES[match.group(1)]
+        text = text[:match.start()]
+
+    strength = None
+    match = STRENGTH_PATTERN.search(text)
+    if match:
+        unit = UNIT_NAMES[match.group(2)]
+        strength = f"{match.group(1)}{unit}" if unit in ("K", "%") else f"{match.group(1)} {unit}"
+        text = (text[:match.start()] + text[match.end():])
+    else:
+        match = BARE_STRENGTH_PATTERN.search(text.strip(" .,-"))
+        if match:
+            strength = match.group(1)
+            text = text.strip(" .,-")[:match.start()]
+
+    name = " ".join(text.strip(" .,-").split())
+    return form, name, strength
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    Trigram posting lists for fuzzy matching, read from a memory-mapped
+    file so a large index costs neither start-up time nor heap memory.
+    """
+
+    def __init__(self, path):
+        import numpy as np
+
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        _, self.lexicon_size, self.lexicon_mtime_ns, gram_count, posting_count, entry_count = \
+            INDEX_HEADER.unpack_from(self._mm)
+
+        offset = INDEX_HEADER.size
+        self.offsets = np.frombuffer(self._mm, dtype="<u8", count=gram_count + 1, offset=offset)
+        offset += self.offsets.nbytes
+        self.postings = np.frombuffer(self._mm, dtype="<u4", count=posting_count, offset=offset)
+        offset += self.postings.nbytes
+        self.sizes = np.frombuffer(self._mm, dtype="u1", count=entry_count, offset=offset)
+        offset += self.sizes.nbytes
+        self.grams = np.frombuffer(self._mm, dtype=f"S{GRAM_KEY_BYTES}", count=gram_count, offset=offset)
+
+    def matches(self, lexicon_path):
+        """True if the index was built from the lexicon as it is now."""
+        stat = os.stat(lexicon_path)
+        return (stat.st_size, stat.st_mtime_ns) == (self.lexicon_size, self.lexicon_mtime_ns)
+
+    def lookup(self, grams):
+        """Posting lists (entry indexes) for each of ``grams`` present in the index."""
+        import numpy as np
+
+        keys = np.array([gram.encode("utf-8") for gram in grams], dtype=f"S{GRAM_KEY_BYTES}")
+        positions = np.searchsorted(self.grams, keys)
+        lists = []
+        for key, position in zip(keys, positions):
+            if position < len(self.grams) and self.grams[position] == key:
+                lists.append(self.postings[self.offsets[position]:self.offsets[position + 1]])
+        return lists
+
+    def close(self):
+        # Drop the numpy views before closing the map they point into
+        self.offsets = self.postings = self.sizes = self.grams = None
+        self._mm.close()
+        self._file.close()
+
+
+def build_trigram_index(lexicon, path):
+    """
+    Writes the trigram index for ``lexicon`` to ``path``.
+
+    Only needed once per lexicon version; get_lexicon() does it
+    automatically when the index is missing or older than the lexicon.
+    """
+    postings = {}
+    sizes = array("B")
+    for i in range(len(lexicon)):
+        grams = _trigrams(lexicon.entry(i))
+        sizes.append(min(len(grams), 255))
+        for gram in grams:
+            entries = postings.get(gram)
+            if entries is None:
+                entries = postings[gram] = array("I")
+            entries.append(i)
+
+    keys = sorted((gram.encode("utf-8"), gram) for gram in postings)
+    offsets = array("Q", [0])
+    for _, gram in keys:
+        offsets.append(offsets[-1] + len(postings[gram]))
+
+    stat = os.stat(lexicon.path)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns,
+                                  len(keys), offsets[-1], len(lexicon)))
+        f.write(offsets.tobytes())
+        for _, gram in keys:
+            f.write(postings[gram].tobytes())
+        f.write(sizes.tobytes())
+        for key, _ in keys:
+            f.write(key.ljust(GRAM_KEY_BYTES, b"\0"))
+    os.replace(temp_path, path)
+
+
+class MedicineLexicon:
+    """
+    Sorted, newline-separated list of canonical medicine names, memory
+    mapped so that large lexicons are not copied into Python strings.
+
+    Exact and prefix lookups binary-search the mapped file directly; fuzzy
+    matching uses a trigram index persisted next to the lexicon.
+    """
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + INDEX_SUFFIX
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = array("Q")
+        self._trigram_index = None
+        self._index_lock = threading.Lock()
+
+        position = 0
+        size = len(self._mm)
+        while position < size:
+            self._offsets.append(position)
+            end = self._mm.find(b"\n", position)
+            position = size if end == -1 else end + 1
+        self._offsets.append(size)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def entry(self, index):
+        """Return the canonical name stored at ``index``."""
+        return self._mm[self._offsets[index]:self._offsets[index + 1]].rstrip(b"\r\n").decode("utf-8")
+
+    def _bisect(self, key):
+        key = key.encode("utf-8")
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            if self._mm[self._offsets[mid]:self._offsets[mid + 1]].rstrip(b"\r\n") < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def lookup(self, name):
+        """Exact lookup; returns the canonical name or None."""
+        index = self._bisect(name)
+        if index < len(self) and self.entry(index) == name:
+            return self.entry(index)
+        return None
+
+    def prefix(self, prefix, limit=10):
+        """Return up to ``limit`` entries starting with ``prefix``."""
+        results = []
+        index = self._bisect(prefix)
+        while index < len(self) and len(results) < limit:
+            entry = self.entry(index)
+            if not entry.startswith(prefix):
+                break
+            results.append(entry)
+            index += 1
+        return results
+
+    def _load_trigram_index(self):
+        if os.path.exists(self.index_path):
+            index = TrigramIndex(self.index_path)
+            if index.matches(self.path):
+                return index
+            index.close()
+        try:
+            build_trigram_index(self, self.index_path)
+        except OSError:
+            # Lexicon folder is read-only (e.g. an installed package)
+            self.index_path = os.path.join(tempfile.gettempdir(), os.path.basename(self.index_path))
+            build_trigram_index(self, self.index_path)
+        return TrigramIndex(self.index_path)
+
+    def fuzzy(self, name, threshold=FUZZY_MATCH_THRESHOLD):
+        """
+        Best trigram match for ``name``.
+
+        Only entries whose trigram count could reach ``threshold`` are
+        counted, and very common trigrams are skipped; the best few
+        candidates are then scored exactly.
+
+        Returns:
+            Tuple of (canonical_name, score), or (None, 0.0) if nothing
+            scores above ``threshold``.
+        """
+        import numpy as np
+
+        if self._trigram_index is None:
+            # Batch workers normalize names concurrently; build the index once
+            with self._index_lock:
+                if self._trigram_index is None:
+                    self._trigram_index = self._load_trigram_index()
+
+        grams = _trigrams(name)
+        common_limit = max(COMMON_GRAM_MIN, int(len(self) * COMMON_GRAM_FRACTION))
+        lists = [entries for entries in self._trigram_index.lookup(grams) if len(entries) <= common_limit]
+        if not lists:
+            return None, 0.0
+
+        ids, counts = np.unique(np.concatenate(lists), return_counts=True)
+
+        # Dice >= t needs the entry's trigram count within [n*t/(2-t), n*(2-t)/t]
+        sizes = self._trigram_index.sizes[ids].astype(np.int32)
+        low = math.ceil(len(grams) * threshold / (2 - threshold))
+        high = math.floor(len(grams) * (2 - threshold) / threshold)
+        keep = (sizes >= low) & (sizes <= high)
+        ids, counts, sizes = ids[keep], counts[keep], sizes[keep]
+
+        estimates = 2 * counts / (len(grams) + sizes)
+        top = np.argsort(estimates)[::-1][:FUZZY_CANDIDATES]
+
+        best, best_score = None, 0.0
+        for index in ids[top]:
+            entry = self.entry(int(index))
+            entry_grams = _trigrams(entry)
+            score = 2 * len(grams & entry_grams) / (len(grams) + len(entry_grams))
+            if score > best_score:
+                best, best_score = entry, score
+
+        if best_score < threshold:
+            return None, 0.0
+        return best, round(best_score, 2)
+
+    def close(self):
+        if self._trigram_index is not None:
+            self._trigram_index.close()
+        self._mm.close()
+        self._file.close()
+
+
+def get_lexicon():
+    """Return the shared lexicon, loading it on first use (None if missing)."""
+    global _lexicon
+
+    if _lexicon is None and os.path.exists(LEXICON_FILE):
+        _lexicon = MedicineLexicon(LEXICON_FILE)
+
+    return _lexicon
+
+
+def normalize_medicine_name(raw_name):
+    """
+    Normalizes an extracted medicine name against the local lexicon.
+
+    Returns:
+        Dict with form, name, strength, the matched canonical name (None
+        when the medicine is not in the lexicon) and the match score.
+    """
+    form, name, strength = split_medicine_name(raw_name)
+
+    canonical, score = None, 0.0
+    lexicon = get_lexicon()
+    if lexicon is not None and name:
+        canonical = lexicon.lookup(name)
+        if canonical is not None:
+            score = 1.0
+        else:
+            canonical, score = lexicon.fuzzy(name)
+
+    return {
+        "form": form,
+        "name": name,
+        "strength": strength,
+        "canonical_name": canonical,
+        "match_score": score
+    }
@@ -0,0 +1,222 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from modules.schema import MEDICINE_FIELDS, MISSING_VALUE, medicine_key, validate_extraction
+
+# Fields whose "unclear" value makes a medicine worth refining
+REFINE_FIELDS = ["dosage_pattern", "frequency", "duration", "food_instruction"]
+
+# Crops are upscaled until their longer side is at least this many pixels
+REFINE_MIN_SIDE = 1024
+REFINE_MAX_UPSCALE = 3.0
+
+# Extra context kept around each region, as a fraction of the image size
+REFINE_PADDING = 0.02
+
+MAX_REFINE_WORKERS = 4
+
+LOCATE_PROMPT = """
+Find where each of these medicines is written on the prescription image,
+including the dosage, timing and duration written on the same line(s):
+
+{medicines}
+
+For each medicine return box_2d as [ymin, xmin, ymax, xmax], normalized to 0-1000.
+"""
+
+REFINE_PROMPT = """
+This image is an enlarged crop of ONE medicine line from a handwritten
+prescription. The medicine was read as: {medicine_name}
+
+Extract: medicine_name, dosage_pattern, frequency, duration,
+food_instruction, special_notes, confidence_note (High / Medium / Low).
+
+Also write summary_line: a patient-friendly instruction in the format
+"[MEDICINE_NAME]: Take ..." or "[MEDICINE_NAME]: Apply ...".
+
+Do NOT guess missing information; if unclear, write "unclear".
+"""
+
+LOCATE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "regions": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "medicine_name": {"type": "STRING"},
+                    "box_2d": {"type": "ARRAY", "items": {"type": "INTEGER"}}
+                },
+                "required": ["medicine_name", "box_2d"]
+            }
+        }
+    },
+    "required": ["regions"]
+}
+
+REFINE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        **{field: {"type": "STRING"} for field in MEDICINE_FIELDS},
+        "summary_line": {"type": "STRING"}
+    },
+    "required": MEDICINE_FIELDS + ["summary_line"]
+}
+
+CONFIDENCE_RANK = {"low": 1, "medium": 2, "high": 3}
+
+
+def uncertain_medicines(result):
+    """Indices of medicines with Low confidence or unclear key fields."""
+    return [
+        index for index, med in enumerate(result.get("structured_data", []))
+        if med.get("confidence_note", "").lower() in ("low", "unclear")
+        or any(med.get(field, "").lower() == MISSING_VALUE for field in REFINE_FIELDS)
+    ]
+
+
+def crop_region(img, box_2d):
+    """Crop a 0-1000 normalized [ymin, xmin, ymax, xmax] box with padding, upscaled."""
+    from PIL import Image
+
+    ymin, xmin, ymax, xmax = box_2d
+    width, height = img.size
+    pad_x, pad_y = REFINE_PADDING * width, REFINE_PADDING * height
+    left = max(0, int(xmin / 1000 * width - pad_x))
+    top = max(0, int(ymin / 1000 * height - pad_y))
+    right = min(width, int(xmax / 1000 * width + pad_x))
+    bottom = min(height, int(ymax / 1000 * height + pad_y))
+    if right - left < 8 or bottom - top < 8:
+        return None
+
+    crop = img.crop((left, top, right, bottom))
+    scale = min(REFINE_MAX_UPSCALE, REFINE_MIN_SIDE / max(crop.size))
+    if scale > 1:
+        crop = crop.resize((int(crop.width * scale), int(crop.height * scale)), Image.LANCZOS)
+    return crop
+
+
+def _same_medicine_line(asked, read):
+    """
+    True when the name read from a crop is the medicine that was asked
+    about, ignoring the form ("TAB.") and punctuation. A wrong or adjacent
+    box reads another line, whose values must not be merged in.
+    """
+    from modules.lexicon import split_medicine_name
+
+    if medicine_key(asked) in ("", MISSING_VALUE.upper()):
+        return False
+    if medicine_key(asked) == medicine_key(read):
+        return True
+    _, asked_name, asked_strength = split_medicine_name(asked)
+    _, read_name, read_strength = split_medicine_name(read)
+    if not asked_name or medicine_key(asked_name) != medicine_key(read_name):
+        return False
+    # "40" and "40 mg" are the same strength; "40" and "20 mg" are not
+    if asked_strength and read_strength:
+        return re.sub(r"[^\d.]", "", asked_strength) == re.sub(r"[^\d.]", "", read_strength)
+    return True
+
+
+def _merge_refined(med, refined):
+    """Take refined values for fields that were unclear or low confidence."""
+    was_low = med.get("confidence_note", "").lower() in ("low", "unclear")
+    new_rank = CONFIDENCE_RANK.get(refined.get("confidence_note", "").lower(), 0)
+    if new_rank <= CONFIDENCE_RANK.get(med.get("confidence_note", "").lower(), 0) and not any(
+        med.get(field, "").lower() == MISSING_VALUE for field in REFINE_FIELDS
+    ):
+        return False
+
+    changed = False
+    for field in MEDICINE_FIELDS:
+        if field in ("medicine_name", "confidence_note"):
+            continue
+        value = refined.get(field, "")
+        if value and value.lower() != MISSING_VALUE and (was_low or med.get(field, "").lower() == MISSING_VALUE):
+            changed = changed or med.get(field) != value
+            med[field] = value
+
+    if new_rank > CONFIDENCE_RANK.get(med.get("confidence_note", "").lower(), 0):
+        med["confidence_note"] = refined["confidence_note"].capitalize()
+        changed = True
+    return changed
+
+
+def _replace_summary_line(summary, medicine_name, summary_line):
+    lines = summary.splitlines()
+    for i, line in enumerate(lines):
+        number, _, rest = line.partition(". ")
+        if number.strip().isdigit() and rest.upper().startswith(medicine_name.upper()):
+            lines[i] = f"{number}. {summary_line}"
+            break
+    return "\n".join(lines)
+
+
+def refine_uncertain_medicines(client, img, result, generate, model):
+    """
+    Re-reads only the uncertain lines of a prescription.
+
+    One call asks the model where those medicines are written; each
+    region is then cropped, upscaled and re-queried on its own, in
+    parallel. Refined fields are merged back into ``result`` in place.
+
+    Args:
+        generate: The extractor's generate function
+            (client, contents, schema, model, max_output_tokens)
+
+    Returns:
+        Number of medicines whose fields were improved.
+    """
+    indices = uncertain_medicines(result)
+    if not indices:
+        return 0
+
+    medicines = result["structured_data"]
+    names = [medicines[i]["medicine_name"] for i in indices]
+    prompt = LOCATE_PROMPT.format(medicines="\n".join(f"- {name}" for name in names))
+    response = generate(client, [prompt, img], LOCATE_SCHEMA, model, max_output_tokens=1024)
+
+    from modules.schema import repair_truncated_json
+    located = repair_truncated_json(response.text or "") or {}
+    boxes = {
+        str(region.get("medicine_name", "")).strip().upper(): region.get("box_2d")
+        for region in located.get("regions", []) if isinstance(region, dict)
+    }
+
+    crops = []
+    for index in indices:
+        box = boxes.get(medicines[index]["medicine_name"].strip().upper())
+        if not box or len(box) != 4:
+            continue
+        crop = crop_region(img, box)
+        if crop is not None:
+            crops.append((index, crop))
+
+    def refine_one(index, crop):
+        prompt = REFINE_PROMPT.format(medicine_name=medicines[index]["medicine_name"])
+        response = generate(client, [prompt, crop], REFINE_SCHEMA, model, max_output_tokens=1024)
+        refined = repair_truncated_json(response.text or "")
+        if not refined:
+            return index, None
+        try:
+            validated, _ = validate_extraction({"structured_data": [refined], "patient_summary": ""})
+        except ValueError:
+            return index, None
+        record = validated["structured_data"][0]
+        if not _same_medicine_line(medicines[index]["medicine_name"], record["medicine_name"]):
+            return index, None
+        record["summary_line"] = str(refined.get("summary_line") or "").strip()
+        return index, record
+
+    refined_count = 0
+    with ThreadPoolExecutor(max_workers=MAX_REFINE_WORKERS) as executor:
+        for index, refined in executor.map(lambda item: refine_one(*item), crops):
+            if refined is None:
+                continue
+            if _merge_refined(medicines[index], refined):
+                refined_count += 1
+                if refined["summary_line"]:
+                    result["patient_summary"] = _replace_summary_line(
+                        result.get("patient_summary", ""), medicines[index]["medicine_name"], refined["summary_line"]
+                    )
+    return refined_count
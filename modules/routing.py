@@ -0,0 +1,115 @@
+import json
+import os
+from datetime import datetime
+
+# Cheapest/fastest first; extraction escalates down this list.
+MODEL_TIERS = [
+    {"name": "fast", "model": "gemini-2.5-flash-lite"},
+    {"name": "standard", "model": "gemini-2.5-flash"},
+    {"name": "accurate", "model": "gemini-2.5-pro"},
+]
+
+ROUTING_LOG_FILE = "routing_log.jsonl"
+
+# Images at or above both thresholds start on the fast tier. Sharpness is
+# what separates printed from handwritten pages (crisp glyph edges);
+# check changes with python -m benchmarks.routing_thresholds.
+CLEAN_MIN_CONTRAST = 45.0
+CLEAN_MIN_SHARPNESS = 20.5
+
+
+def assess_image_quality(img):
+    """
+    Cheap clarity estimate computed on a small grayscale thumbnail.
+
+    Returns:
+        Dict with contrast (grayscale std-dev) and sharpness (mean edge
+        strength), both on a 0-255 scale.
+    """
+    from PIL import ImageFilter, ImageOps, ImageStat
+
+    gray = ImageOps.grayscale(img)
+    gray.thumbnail((512, 512))
+    contrast = ImageStat.Stat(gray).stddev[0]
+    sharpness = ImageStat.Stat(gray.filter(ImageFilter.FIND_EDGES)).mean[0]
+    return {"contrast": round(contrast, 2), "sharpness": round(sharpness, 2)}
+
+
+def choose_start_tier(quality):
+    """Clean, high-contrast images start on the fast tier, others one up."""
+    if quality["contrast"] >= CLEAN_MIN_CONTRAST and quality["sharpness"] >= CLEAN_MIN_SHARPNESS:
+        return 0
+    return 1
+
+
+def escalation_reason(result):
+    """Return why ``result`` should be retried on a stronger tier, or None."""
+    if result.get("truncated"):
+        # Output was cut off mid-list; later medicines are missing
+        return "truncated_output"
+    medicines = result.get("structured_data", [])
+    if not medicines:
+        return "no_medicines"
+    low = [m for m in medicines if m.get("confidence_note", "").lower() in ("low", "unclear")]
+    if low:
+        return f"low_confidence:{len(low)}"
+    return None
+
+
+def log_routing_decision(routing):
+    """Append one routing decision to the routing log."""
+    entry = {"date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **routing}
+    with open(ROUTING_LOG_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def combine_routing(page_routings):
+    """Summarizes the routing of a multi-page prescription."""
+    return {
+        "model": max(
+            (r["model"] for r in page_routings),
+            key=lambda model: [t["model"] for t in MODEL_TIERS].index(model)
+        ),
+        "escalated": any(r["escalated"] for r in page_routings),
+        "latency_ms": round(sum(r["latency_ms"] for r in page_routings), 1),
+        "pages": page_routings
+    }
+
+
+def get_routing_statistics():
+    """Escalation rate and per-tier latency from the routing log."""
+    if not os.path.exists(ROUTING_LOG_FILE):
+        return None
+
+    decisions = 0
+    escalated = 0
+    tiers = {}
+    with open(ROUTING_LOG_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            decisions += 1
+            escalated += 1 if entry["escalated"] else 0
+            for attempt in entry["attempts"]:
+                tier = tiers.setdefault(attempt["tier"], {"calls": 0, "total_latency_ms": 0.0, "escalated_from": 0})
+                tier["calls"] += 1
+                tier["total_latency_ms"] += attempt["latency_ms"]
+                if attempt.get("escalate_reason"):
+                    tier["escalated_from"] += 1
+
+    if not decisions:
+        return None
+
+    return {
+        "decisions": decisions,
+        "escalation_rate": round(100 * escalated / decisions, 2),
+        "tiers": {
+            name: {
+                "calls": t["calls"],
+                "avg_latency_ms": round(t["total_latency_ms"] / t["calls"], 1),
+                "escalation_rate": round(100 * t["escalated_from"] / t["calls"], 2)
+            }
+            for name, t in tiers.items()
+        }
+    }
@@ -0,0 +1,321 @@
+import os
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+import numpy as np
+
+SCHEDULE_FOLDER = "schedule"
+BASE_INDEX_FILE = os.path.join(SCHEDULE_FOLDER, "base.npy")
+DELTA_INDEX_FILE = os.path.join(SCHEDULE_FOLDER, "delta.bin")
+
+# Appended events are merged into the sorted base once the delta grows past this
+DELTA_MERGE_EVENTS = 50000
+
+# Used when the duration is "Till Next Visit", "unclear" or unparseable
+DEFAULT_DURATION_DAYS = 30
+
+# Minutes after midnight for each dose slot
+SLOT_MINUTES = {
+    "morning": 8 * 60,
+    "afternoon": 14 * 60,
+    "evening": 18 * 60,
+    "night": 21 * 60,
+}
+SLOT_NAMES = list(SLOT_MINUTES)
+
+# Doses taken before food are due half an hour before the meal slot
+BEFORE_FOOD_OFFSET_MINUTES = -30
+
+# Slots used for "1-0-1" (3 parts) and "1-1-1-1" (4 parts) patterns
+PATTERN_SLOTS = {
+    3: ["morning", "afternoon", "night"],
+    4: ["morning", "afternoon", "evening", "night"],
+}
+
+# Fallback slots when the dosage pattern is not a 1-0-1 style pattern
+FREQUENCY_SLOTS = {
+    "od": ["morning"],
+    "once": ["morning"],
+    "bd": ["morning", "night"],
+    "twice": ["morning", "night"],
+    "tds": ["morning", "afternoon", "night"],
+    "thrice": ["morning", "afternoon", "night"],
+    "three times": ["morning", "afternoon", "night"],
+    "qid": ["morning", "afternoon", "evening", "night"],
+    "hs": ["night"],
+    "bedtime": ["night"],
+}
+
+# Days between doses for non-daily frequencies
+FREQUENCY_STEP_DAYS = {
+    "alternate": 2,
+    "weekly": 7,
+    "once a week": 7,
+    "monthly": 30,
+    "once a month": 30,
+}
+
+# Taken only when needed, so no events are scheduled
+AS_NEEDED_WORDS = ("as needed", "sos", "when required", "prn")
+
+EVENT_DTYPE = np.dtype([
+    ("time", "<i8"),          # minutes since the Unix epoch, local time
+    ("prescription", "<i8"),  # prescription id as a number, see _prescription_number
+    ("medicine", "<i2"),      # index into the record's medicines
+    ("slot", "<i1"),          # index into SLOT_NAMES
+    ("quantity", "<f4"),
+])
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(day|week|month|year)", re.IGNORECASE)
+DURATION_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365}
+
+# One dose quantity: "1", "0.5", "½", "1½", "1/2" or "1 1/2"
+QUANTITY_PATTERN = re.compile(r"(\d+(?:\.\d*)?)?\s*(?:([½¼¾])|(\d+)\s*/\s*(\d+))?")
+VULGAR_FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75}
+
+
+@lru_cache(maxsize=4096)
+def parse_duration_days(duration):
+    match = DURATION_PATTERN.search(duration or "")
+    if not match:
+        return DEFAULT_DURATION_DAYS
+    return max(1, int(float(match.group(1)) * DURATION_DAYS[match.group(2).lower()]))
+
+
+def _parse_quantity(part):
+    """Dose quantity of one pattern part; raises ValueError if it is not one."""
+    match = QUANTITY_PATTERN.fullmatch(part)
+    if not match or not any(match.groups()):
+        raise ValueError(f"Not a dose quantity: {part!r}")
+    whole, vulgar, numerator, denominator = match.groups()
+    quantity = float(whole) if whole else 0.0
+    if vulgar:
+        quantity += VULGAR_FRACTIONS[vulgar]
+    elif numerator:
+        if int(denominator) == 0:
+            raise ValueError(f"Not a dose quantity: {part!r}")
+        quantity += int(numerator) / int(denominator)
+    return quantity
+
+
+@lru_cache(maxsize=4096)
+def parse_dose_slots(dosage_pattern, frequency):
+    """
+    Turn a dosage pattern like "1-0-1" (or a frequency like "BD") into
+    (slot names, quantities). Returns empty tuples for as-needed medicines.
+    """
+    frequency = (frequency or "").lower()
+    if any(word in frequency for word in AS_NEEDED_WORDS):
+        return (), ()
+
+    parts = re.split(r"\s*-\s*", (dosage_pattern or "").strip())
+    if len(parts) in PATTERN_SLOTS:
+        try:
+            quantities = [_parse_quantity(part) for part in parts]
+        except ValueError:
+            quantities = None
+        if quantities is not None:
+            slots = PATTERN_SLOTS[len(parts)]
+            return (
+                tuple(slot for slot, q in zip(slots, quantities) if q > 0),
+                tuple(q for q in quantities if q > 0)
+            )
+
+    for word, slots in FREQUENCY_SLOTS.items():
+        if re.search(rf"\b{word}\b", frequency):
+            return tuple(slots), (1.0,) * len(slots)
+
+    # "Daily", "every day" or unclear: one dose in the morning
+    return ("morning",), (1.0,)
+
+
+@lru_cache(maxsize=4096)
+def _frequency_step_days(frequency):
+    frequency = (frequency or "").lower()
+    for word, step in FREQUENCY_STEP_DAYS.items():
+        if word in frequency:
+            return step
+    return 1
+
+
+# Ids with microseconds (20260227_224637_123456) do not fit int64 as digits,
+# so they are stored as microseconds since 1970-01-01 local time. Older ids
+# (20260227_224637) keep their digits, which are always below this bound.
+ID_EPOCH = datetime(1970, 1, 1)
+LEGACY_ID_LIMIT = 10 ** 14
+
+
+def _prescription_number(prescription_id):
+    if len(prescription_id) == 15:
+        return int(prescription_id.replace("_", ""))
+    moment = datetime.strptime(prescription_id, "%Y%m%d_%H%M%S_%f")
+    return (moment - ID_EPOCH) // timedelta(microseconds=1)
+
+
+def _prescription_id(number):
+    if number < LEGACY_ID_LIMIT:
+        text = str(number)
+        return f"{text[:8]}_{text[8:]}"
+    return (ID_EPOCH + timedelta(microseconds=number)).strftime("%Y%m%d_%H%M%S_%f")
+
+
+def _to_minutes(moment):
+    return int(np.datetime64(moment, "m").astype(np.int64))
+
+
+def build_dose_events(records):
+    """
+    Concrete dose events for history records, as a time-sorted EVENT_DTYPE array.
+
+    Doses start on the day after a prescription was recorded. Medicines
+    that share the same schedule (slots, quantities, duration, step and
+    food offset) are grouped, and all their (start, day, slot) events are
+    produced in one numpy broadcast instead of Python loops over days.
+    """
+    groups = {}
+    for record in records:
+        start_day = np.datetime64(record["date"][:10], "D") + 1
+        prescription = _prescription_number(record["id"])
+        for medicine_index, med in enumerate(record["medicines"]):
+            slots, quantities = parse_dose_slots(med.get("dosage"), med.get("frequency"))
+            if not slots:
+                continue
+            offset = BEFORE_FOOD_OFFSET_MINUTES if "before" in (med.get("food") or "").lower() else 0
+            key = (
+                slots, quantities, offset,
+                parse_duration_days(med.get("duration")),
+                _frequency_step_days(med.get("frequency"))
+            )
+            groups.setdefault(key, []).append((start_day, prescription, medicine_index))
+
+    chunks = []
+    for (slots, quantities, offset, duration_days, step_days), members in groups.items():
+        start_days, prescriptions, medicines = zip(*members)
+        starts = np.array(start_days, dtype="datetime64[D]").astype("datetime64[m]").astype(np.int64)
+        days = np.arange(0, duration_days, step_days, dtype=np.int64)
+        slot_minutes = np.array([SLOT_MINUTES[slot] + offset for slot in slots], dtype=np.int64)
+
+        # Shape: (members, days, slots)
+        times = starts[:, None, None] + days[None, :, None] * 1440 + slot_minutes[None, None, :]
+        per_member = len(days) * len(slots)
+
+        events = np.empty(times.size, dtype=EVENT_DTYPE)
+        events["time"] = times.ravel()
+        events["prescription"] = np.repeat(np.array(prescriptions, dtype=np.int64), per_member)
+        events["medicine"] = np.repeat(np.array(medicines, dtype=np.int16), per_member)
+        events["slot"] = np.tile([SLOT_NAMES.index(slot) for slot in slots], len(members) * len(days))
+        events["quantity"] = np.tile(quantities, len(members) * len(days))
+        chunks.append(events)
+
+    if not chunks:
+        return np.empty(0, dtype=EVENT_DTYPE)
+    events = np.concatenate(chunks)
+    return events[np.argsort(events["time"], kind="stable")]
+
+
+def _load_base():
+    if os.path.exists(BASE_INDEX_FILE):
+        return np.load(BASE_INDEX_FILE, mmap_mode="r")
+    return np.empty(0, dtype=EVENT_DTYPE)
+
+
+def _load_delta():
+    if os.path.exists(DELTA_INDEX_FILE):
+        return np.fromfile(DELTA_INDEX_FILE, dtype=EVENT_DTYPE)
+    return np.empty(0, dtype=EVENT_DTYPE)
+
+
+def _write_base(events):
+    os.makedirs(SCHEDULE_FOLDER, exist_ok=True)
+    tmp_path = BASE_INDEX_FILE + ".tmp.npy"
+    np.save(tmp_path, events)
+    os.replace(tmp_path, BASE_INDEX_FILE)
+    if os.path.exists(DELTA_INDEX_FILE):
+        os.remove(DELTA_INDEX_FILE)
+
+
+def merge_schedule(drop_before=None):
+    """
+    Merge appended events into the sorted base index, optionally dropping
+    events before ``drop_before`` (a datetime) to keep the index small.
+    """
+    events = np.concatenate([np.asarray(_load_base()), _load_delta()])
+    if drop_before is not None:
+        events = events[events["time"] >= _to_minutes(drop_before)]
+    _write_base(events[np.argsort(events["time"], kind="stable")])
+
+
+def add_record_to_schedule(record):
+    """
+    Add one prescription's dose events to the index.
+
+    Events are appended to a small delta file, so adding a record costs
+    only its own events; the delta is merged into the base periodically.
+    """
+    events = build_dose_events([record])
+    if not len(events):
+        return 0
+
+    os.makedirs(SCHEDULE_FOLDER, exist_ok=True)
+    with open(DELTA_INDEX_FILE, "ab") as f:
+        events.tofile(f)
+
+    if os.path.getsize(DELTA_INDEX_FILE) // EVENT_DTYPE.itemsize > DELTA_MERGE_EVENTS:
+        merge_schedule(drop_before=datetime.now() - timedelta(days=1))
+    return len(events)
+
+
+def rebuild_schedule(records, drop_before=None):
+    """Rebuild the whole index from history records."""
+    events = build_dose_events(records)
+    if drop_before is not None:
+        events = events[events["time"] >= _to_minutes(drop_before)]
+    _write_base(events)
+    return len(events)
+
+
+def due_events(start, end):
+    """
+    All dose events with start <= time < end, across every prescription.
+
+    The base index is sorted by time and memory-mapped, so this is two
+    binary searches plus a scan of the (small) unmerged delta.
+    """
+    start_minutes, end_minutes = _to_minutes(start), _to_minutes(end)
+
+    base = _load_base()
+    low, high = np.searchsorted(base["time"], [start_minutes, end_minutes], side="left")
+    delta = _load_delta()
+    in_range = (delta["time"] >= start_minutes) & (delta["time"] < end_minutes)
+
+    events = np.concatenate([np.asarray(base[low:high]), delta[in_range]])
+    return events[np.argsort(events["time"], kind="stable")]
+
+
+def describe_due_doses(start, end, load_shard):
+    """
+    Due doses with medicine names, for display.
+
+    Args:
+        load_shard: modules.history.load_shard, used to look up records
+    """
+    records = {}
+    doses = []
+    for event in due_events(start, end):
+        prescription_id = _prescription_id(int(event["prescription"]))
+        if prescription_id not in records:
+            month = f"{prescription_id[:4]}-{prescription_id[4:6]}"
+            records.update({rx['id']: rx for rx in load_shard(month).get("prescriptions", [])})
+        record = records.get(prescription_id)
+        if record is None:
+            continue
+        med = record["medicines"][int(event["medicine"])]
+        doses.append({
+            "time": str(np.datetime64(int(event["time"]), "m")).replace("T", " "),
+            "prescription_id": prescription_id,
+            "medicine": med["name"],
+            "slot": SLOT_NAMES[int(event["slot"])],
+            "quantity": float(event["quantity"]),
+            "food": med.get("food", "unclear")
+        })
+    return doses
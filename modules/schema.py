@@ -0,0 +1,225 @@
+import json
+import re
+
+MEDICINE_FIELDS = [
+    "medicine_name",
+    "dosage_pattern",
+    "frequency",
+    "duration",
+    "food_instruction",
+    "special_notes",
+    "confidence_note"
+]
+
+CONFIDENCE_LEVELS = ["High", "Medium", "Low"]
+
+MISSING_VALUE = "unclear"
+
+# Passed to Gemini as response_schema so the model emits this shape directly.
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "structured_data": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    field: (
+                        {"type": "STRING", "enum": CONFIDENCE_LEVELS}
+                        if field == "confidence_note" else {"type": "STRING"}
+                    )
+                    for field in MEDICINE_FIELDS
+                },
+                "required": MEDICINE_FIELDS,
+                "property_ordering": MEDICINE_FIELDS
+            }
+        },
+        "patient_summary": {"type": "STRING"}
+    },
+    "required": ["structured_data", "patient_summary"],
+    "property_ordering": ["structured_data", "patient_summary"]
+}
+
+
+def repair_truncated_json(raw_text):
+    """
+    Closes a JSON document that was cut off mid-way (e.g. when the model
+    hit max_output_tokens), dropping the incomplete trailing value.
+
+    Returns:
+        The parsed object, or None if nothing usable could be recovered.
+    """
+    start = raw_text.find("{")
+    if start == -1:
+        return None
+    text = raw_text[start:]
+
+    # Track open brackets, and remember where the last complete value ended
+    # so a half-written key or value can be cut off.
+    stack = []
+    in_string = False
+    escaped = False
+    cut_points = []
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]":
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                try:
+                    return json.loads(text[:i + 1])
+                except json.JSONDecodeError:
+                    return None
+            cut_points.append((i + 1, list(stack)))
+        elif char == ",":
+            cut_points.append((i, list(stack)))
+
+    for end, open_brackets in reversed(cut_points):
+        closers = "".join("}" if b == "{" else "]" for b in reversed(open_brackets))
+        try:
+            return json.loads(text[:end] + closers)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def _as_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(v) for v in value)
+    return str(value).strip()
+
+
+def medicine_key(medicine_name):
+    """Key used to recognise the same medicine across pages and re-reads."""
+    return re.sub(r"[^A-Z0-9]", "", medicine_name.upper())
+
+
+def normalize_confidence(value):
+    """Map a model's confidence label onto CONFIDENCE_LEVELS; anything else is Low."""
+    confidence = _as_text(value).capitalize()
+    return confidence if confidence in CONFIDENCE_LEVELS else "Low"
+
+
+def validate_re_asked_value(field, value):
+    """
+    Validates one value returned by a targeted re-ask.
+
+    Returns:
+        The cleaned value, or "" if there is nothing usable to write back.
+    """
+    value = _as_text(value)
+    if field == "confidence_note" and value:
+        return normalize_confidence(value)
+    return value
+
+
+def validate_extraction(parsed):
+    """
+    Validates a parsed extraction result and normalizes it into the shape
+    the rest of the app indexes directly.
+
+    Every medicine gets all MEDICINE_FIELDS as strings; absent or empty
+    fields are set to MISSING_VALUE and reported so they can be re-asked.
+
+    Returns:
+        Tuple of (result, missing) where missing is a list of
+        (medicine_index, field) pairs. medicine_index is None for the
+        patient_summary.
+    """
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("structured_data"), list):
+        raise ValueError("Model output is missing structured_data.")
+
+    missing = []
+    medicines = []
+    for med in parsed["structured_data"]:
+        if not isinstance(med, dict):
+            continue
+        record = {}
+        for field in MEDICINE_FIELDS:
+            value = _as_text(med.get(field))
+            if not value:
+                missing.append((len(medicines), field))
+                value = MISSING_VALUE
+            record[field] = value
+
+        record["confidence_note"] = normalize_confidence(record["confidence_note"])
+        medicines.append(record)
+
+    summary = _as_text(parsed.get("patient_summary"))
+    if not summary:
+        missing.append((None, "patient_summary"))
+
+    result = dict(parsed)
+    result["structured_data"] = medicines
+    result["patient_summary"] = summary
+    return result, missing
+
+
+def parse_extraction(raw_text):
+    """
+    Parses and validates raw model output, repairing truncated JSON.
+
+    Returns:
+        Tuple of (result, missing) as returned by validate_extraction.
+        A repaired result has "truncated" set: medicines after the cut
+        are lost, so it must not be treated as complete.
+    """
+    raw_text = raw_text.strip()
+
+    # Sometimes Gemini wraps output in ```json
+    if raw_text.startswith("```"):
+        raw_text = raw_text.replace("```json", "").replace("```", "").strip()
+
+    try:
+        parsed = json.loads(raw_text)
+    except json.JSONDecodeError:
+        parsed = repair_truncated_json(raw_text)
+        if parsed is None:
+            raise ValueError("Model did not return valid JSON.")
+        result, missing = validate_extraction(parsed)
+        result["truncated"] = True
+        return result, missing
+
+    return validate_extraction(parsed)
+
+
+def build_missing_fields_schema(fields):
+    """Response schema for a targeted re-ask covering only ``fields``."""
+    return {
+        "type": "OBJECT",
+        "properties": {
+            "medicines": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "medicine_name": {"type": "STRING"},
+                        **{
+                            field: (
+                                {"type": "STRING", "enum": CONFIDENCE_LEVELS}
+                                if field == "confidence_note" else {"type": "STRING"}
+                            )
+                            for field in fields if field != "patient_summary"
+                        }
+                    },
+                    "required": ["medicine_name"]
+                }
+            },
+            **({"patient_summary": {"type": "STRING"}} if "patient_summary" in fields else {})
+        },
+        "required": ["medicines"]
+    }
@@ -0,0 +1,358 @@
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+SAMPLE_EXTRACTION = {
+    "structured_data": [
+        {
+            "medicine_name": "TAB. SOMPRAZ 40MG",
+            "dosage_pattern": "1-0-1",
+            "frequency": "every day",
+            "duration": "1 month",
+            "food_instruction": "before food",
+            "special_notes": "unclear",
+            "confidence_note": "High"
+        },
+        {
+            "medicine_name": "SYP. DOLCID SYP",
+            "dosage_pattern": "1-0-1",
+            "frequency": "every day",
+            "duration": "1 month",
+            "food_instruction": "before food",
+            "special_notes": "15 ML",
+            "confidence_note": "Medium"
+        }
+    ],
+    "patient_summary": "You have been prescribed the following medicines:\n"
+                       "1. TAB. SOMPRAZ 40MG: Take 1 tablet before morning meal and 1 tablet before night meal, every day for 1 month.\n"
+                       "2. SYP. DOLCID SYP: Take 15 ML before food at 9 AM and 15 ML before food at 9 PM, every day for 1 month."
+}
+
+# A chart is regenerated every this many requests, to catch figure leaks
+CHART_EVERY = 50
+
+# Thresholds used to flag problems in the report
+RSS_LEAK_MB_PER_HOUR = 20.0
+FD_LEAK_COUNT = 10
+THROUGHPUT_DECAY_RATIO = 0.8
+LATENCY_DRIFT_RATIO = 1.5
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModels:
+    """Local stand-in for client.models, with log-normal latency."""
+
+    def __init__(self, median_ms):
+        self.median_ms = median_ms
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(random.lognormvariate(0, 0.4) * self.median_ms / 1000)
+        return _FakeResponse(json.dumps(SAMPLE_EXTRACTION))
+
+
+class FakeGeminiClient:
+    def __init__(self, median_ms):
+        self.models = FakeGeminiModels(median_ms)
+
+
+def _fake_translate(median_ms):
+    def translate(text, language):
+        time.sleep(random.lognormvariate(0, 0.3) * median_ms / 1000)
+        return text
+    return translate
+
+
+def _fake_voice(median_ms):
+    from modules.voice import preprocess_text_for_tts
+
+    def voice(text, language, output_filename):
+        # Exercise the real rule and lexicon pass; only synthesis is faked
+        preprocess_text_for_tts(text, language)
+        time.sleep(random.lognormvariate(0, 0.3) * median_ms / 1000)
+        # Roughly the size of a gTTS summary
+        with open(output_filename, "wb") as f:
+            f.write(os.urandom(64 * 1024))
+        return output_filename
+    return voice
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        # ru_maxrss is the peak, not current, RSS where /proc is missing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _open_fds():
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        if os.path.isdir(fd_dir):
+            return len(os.listdir(fd_dir))
+    return None
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 1)
+
+
+def _slope_per_hour(points):
+    """Least-squares slope of (seconds, value) points, per hour."""
+    if len(points) < 3:
+        return 0.0
+    xs, ys = zip(*points)
+    mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    if not denominator:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator * 3600
+
+
+def check_history_integrity(completed):
+    """
+    Check that every completed request left its own history record and
+    audio file. Colliding ids or audio names mean concurrent saves
+    overwrote each other.
+
+    Returns:
+        Dict with record/id/audio counts and a list of findings.
+    """
+    from modules.history import load_history
+    from modules.lexicon import get_lexicon
+
+    records = load_history().get("prescriptions", [])
+    ids = {rx["id"] for rx in records}
+    audio_files = {rx["audio_file"] for rx in records}
+    missing_audio = sum(1 for path in audio_files if not os.path.exists(path))
+
+    findings = []
+    if len(records) != completed:
+        findings.append(f"History has {len(records)} records for {completed} completed requests")
+    if len(ids) < len(records):
+        findings.append(f"Prescription id collision: {len(records)} records, {len(ids)} unique ids")
+    if len(audio_files) < len(records):
+        findings.append(f"Audio overwritten: {len(records)} records, {len(audio_files)} unique audio files")
+    if missing_audio:
+        findings.append(f"{missing_audio} audio files referenced by history are missing")
+    if get_lexicon() is None:
+        findings.append("Medicine lexicon not found; name normalization was skipped")
+
+    return {
+        "records": len(records),
+        "unique_ids": len(ids),
+        "unique_audio_files": len(audio_files),
+        "missing_audio_files": missing_audio,
+        "findings": findings
+    }
+
+
+def analyze_samples(samples, duration_s=None, warmup_fraction=0.2):
+    """
+    Flag leaks and throughput/latency decay from the time series.
+
+    Samples after ``duration_s`` are ignored: no new requests arrive
+    while in-flight ones drain, so their throughput always looks lower.
+    """
+    if duration_s is not None:
+        samples = [s for s in samples if s["elapsed_s"] <= duration_s]
+    steady = samples[int(len(samples) * warmup_fraction):]
+    findings = []
+    if len(steady) < 3:
+        return {"findings": ["Run too short to analyze; increase --duration"]}
+
+    rss_slope = _slope_per_hour([(s["elapsed_s"], s["rss_mb"]) for s in steady])
+    if rss_slope > RSS_LEAK_MB_PER_HOUR:
+        findings.append(f"Memory leak suspected: RSS growing {rss_slope:.1f} MB/hour")
+
+    fds = [s["open_fds"] for s in steady if s["open_fds"] is not None]
+    if fds and fds[-1] - fds[0] > FD_LEAK_COUNT:
+        findings.append(f"File-handle leak suspected: open fds {fds[0]} -> {fds[-1]}")
+
+    figures = [s["open_figures"] for s in steady]
+    if figures[-1] > figures[0]:
+        findings.append(f"matplotlib figure leak: open figures {figures[0]} -> {figures[-1]}")
+
+    third = max(1, len(steady) // 3)
+    first, last = steady[:third], steady[-third:]
+    first_tp = statistics.fmean(s["throughput_rps"] for s in first)
+    last_tp = statistics.fmean(s["throughput_rps"] for s in last)
+    if first_tp and last_tp < THROUGHPUT_DECAY_RATIO * first_tp:
+        findings.append(f"Throughput decay: {first_tp:.2f} -> {last_tp:.2f} req/s")
+
+    first_p95 = [s["p95_ms"] for s in first if s["p95_ms"] is not None]
+    last_p95 = [s["p95_ms"] for s in last if s["p95_ms"] is not None]
+    if first_p95 and last_p95 and statistics.fmean(last_p95) > LATENCY_DRIFT_RATIO * statistics.fmean(first_p95):
+        findings.append(f"Latency drift: p95 {statistics.fmean(first_p95):.0f} -> {statistics.fmean(last_p95):.0f} ms")
+
+    return {
+        "rss_slope_mb_per_hour": round(rss_slope, 2),
+        "throughput_first_rps": round(first_tp, 2),
+        "throughput_last_rps": round(last_tp, 2),
+        "findings": findings
+    }
+
+
+def run_soak(duration_s=3600, rate=2.0, mode="open", concurrency=4, sample_interval_s=10.0,
+             image_path="samples/sample2.jpeg", extract_ms=800, translate_ms=150, tts_ms=400,
+             report_path=None):
+    """
+    Drive the full pipeline for ``duration_s`` seconds against local
+    stand-ins for Gemini, the translator and TTS, sampling RSS, open file
+    descriptors, open matplotlib figures and latency percentiles. At the
+    end, the history is checked for colliding ids and overwritten audio.
+
+    Args:
+        mode: "open" for Poisson arrivals at ``rate`` requests/second
+            (latency includes queueing), "closed" for ``concurrency``
+            workers issuing requests back-to-back.
+
+    Returns:
+        The report dict, also written as JSON to ``report_path``.
+    """
+    import matplotlib.pyplot as plt
+    import modules.extractor as extractor
+    from modules.history import add_prescription_to_history, generate_accuracy_chart
+
+    image_path = os.path.abspath(image_path)
+    translate = _fake_translate(translate_ms)
+    voice = _fake_voice(tts_ms)
+    extractor._client = FakeGeminiClient(extract_ms)
+
+    lock = threading.Lock()
+    latencies = []
+    completed = [0]
+    errors = []
+    stop = threading.Event()
+
+    def one_request(arrival):
+        try:
+            result = extractor.extract_prescription(image_path)
+            translated = translate(result["patient_summary"], "Telugu")
+            audio = voice(translated, "Telugu", f"soak_{threading.get_ident()}.mp3")
+            add_prescription_to_history(image_path, "Telugu", result["structured_data"], audio,
+                                        routing=result.get("routing"))
+            with lock:
+                completed[0] += 1
+                count = completed[0]
+            if count % CHART_EVERY == 0:
+                generate_accuracy_chart()
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+        finally:
+            with lock:
+                latencies.append((time.perf_counter() - arrival) * 1000)
+
+    original_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="soak_")
+    os.chdir(workdir)
+    samples = []
+    started = time.perf_counter()
+
+    def sampler():
+        last_count = 0
+        last_time = started
+        while not stop.wait(sample_interval_s):
+            now = time.perf_counter()
+            with lock:
+                window = latencies[:]
+                latencies.clear()
+                count = completed[0]
+            samples.append({
+                "elapsed_s": round(now - started, 1),
+                "rss_mb": round(_rss_mb(), 1),
+                "open_fds": _open_fds(),
+                "open_figures": len(plt.get_fignums()),
+                "threads": threading.active_count(),
+                "completed": count,
+                "errors": len(errors),
+                "throughput_rps": round((count - last_count) / (now - last_time), 3),
+                "p50_ms": _percentile(window, 0.50),
+                "p95_ms": _percentile(window, 0.95),
+                "p99_ms": _percentile(window, 0.99),
+            })
+            s = samples[-1]
+            print(f"[{s['elapsed_s']:>7.0f}s] rss {s['rss_mb']:.1f} MB  fds {s['open_fds']}  "
+                  f"figs {s['open_figures']}  {s['throughput_rps']:.2f} req/s  "
+                  f"p50 {s['p50_ms']} ms  p95 {s['p95_ms']} ms  errors {s['errors']}")
+            last_count, last_time = count, now
+
+    sampler_thread = threading.Thread(target=sampler, daemon=True)
+    sampler_thread.start()
+
+    cancelled = 0
+    integrity = None
+    try:
+        deadline = started + duration_s
+        if mode == "open":
+            executor = ThreadPoolExecutor(max_workers=max(concurrency, 32))
+            futures = []
+            try:
+                next_arrival = time.perf_counter()
+                while next_arrival < deadline:
+                    delay = next_arrival - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    futures.append(executor.submit(one_request, next_arrival))
+                    next_arrival += random.expovariate(rate)
+            finally:
+                # Requests still queued at the deadline are dropped, not drained
+                executor.shutdown(wait=True, cancel_futures=True)
+            cancelled = sum(1 for future in futures if future.cancelled())
+        else:
+            def worker():
+                while time.perf_counter() < deadline:
+                    one_request(time.perf_counter())
+
+            workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+    finally:
+        stop.set()
+        sampler_thread.join()
+        try:
+            integrity = check_history_integrity(completed[0])
+        finally:
+            os.chdir(original_dir)
+
+    analysis = analyze_samples(samples, duration_s)
+    analysis["findings"] = integrity["findings"] + analysis["findings"]
+
+    report = {
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {
+            "duration_s": duration_s, "rate": rate, "mode": mode, "concurrency": concurrency,
+            "sample_interval_s": sample_interval_s, "extract_ms": extract_ms,
+            "translate_ms": translate_ms, "tts_ms": tts_ms, "workdir": workdir
+        },
+        "total_completed": completed[0],
+        "total_errors": len(errors),
+        "cancelled_at_deadline": cancelled,
+        "first_errors": errors[:5],
+        "integrity": {key: value for key, value in integrity.items() if key != "findings"},
+        "analysis": analysis,
+        "samples": samples
+    }
+
+    if report_path is None:
+        report_path = f"soak_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    report["report_path"] = report_path
+    return report
@@ -1,7 +1,13 @@
 from gtts import gTTS
+import json
 import os
 import re
 
+TTS_RULES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "tts_rules.json")
+
+_tts_rules = None
+_compiled_rules = {}
+
 LANGUAGE_CODE_MAP = {
     "English": "en",
     "Hindi": "hi",
@@ -20,30 +26,81 @@ LANGUAGE_CODE_MAP = {
 }
 
 
-def preprocess_text_for_tts(text):
+def load_tts_rules(path=TTS_RULES_FILE):
+    """
+    Loads TTS normalization rules from a JSON file.
+
+    The file has a "default" section plus optional per-language sections,
+    each with "abbreviations" (ALL CAPS tokens such as "TAB." or "CAP"),
+    "units" (read after a number, e.g. 40MG) and "words" (literal
+    replacements in any script). Language sections override the default.
+    """
+    global _tts_rules
+
+    with open(path, 'r', encoding='utf-8') as f:
+        _tts_rules = json.load(f)
+    _compiled_rules.clear()
+    return _tts_rules
+
+
+def _alternation(tokens):
+    # Longest first so "TABS" wins over "TAB"
+    return "|".join(re.escape(t) for t in sorted(tokens, key=len, reverse=True))
+
+
+def _compile_rules(language):
+    """Builds the single combined pattern and lookup tables for a language."""
+    if _tts_rules is None:
+        load_tts_rules()
+
+    default = _tts_rules.get("default", {})
+    overrides = _tts_rules.get(language, {})
+    tables = {
+        key: {**default.get(key, {}), **overrides.get(key, {})}
+        for key in ("abbreviations", "units", "words")
+    }
+
+    branches = []
+    if tables["words"]:
+        # Unicode-aware boundaries, so "टैब" is not expanded inside "टैबलेट";
+        # a digit may precede, as in "40एमजी"
+        branches.append(rf"(?<![^\W\d])(?P<word>{_alternation(tables['words'])})(?!\w)")
+    if tables["abbreviations"]:
+        branches.append(rf"(?<![\w.])(?P<abbr>{_alternation(tables['abbreviations'])})\b(?:\.(?= \S))?")
+    if tables["units"]:
+        branches.append(rf"(?<=\d)\s*(?P<unit>{_alternation(tables['units'])})\b")
+    # Remaining ALL CAPS words of 4+ letters are medicine names: read them as words
+    branches.append(r"\b(?P<caps>[A-Z]{4,})\b")
+
+    compiled = (re.compile("|".join(branches)), tables)
+    _compiled_rules[language] = compiled
+    return compiled
+
+
+def preprocess_text_for_tts(text, language="English"):
     """
     Preprocesses text to make it more suitable for text-to-speech.
-    Converts ALL CAPS abbreviations and medicine names to Title Case.
+    Expands dosage-form abbreviations and units and converts ALL CAPS
+    medicine names to Title Case, in a single pass over the text.
+    Medicine names are read as extracted, never swapped for a lexicon match.
     """
-    # Convert TAB. to Tab
-    text = re.sub(r'\bTAB\.\s+', 'Tab ', text)
-    
-    # Convert medicine names from ALL CAPS to Title Case
-    # Pattern: Anything after "Tab " that is in ALL CAPS until a number or space-number
-    def capitalize_medicine(match):
-        medicine_name = match.group(1)
-        # Convert to Title Case (first letter uppercase, rest lowercase)
-        return 'Tab ' + ' '.join(word.capitalize() for word in medicine_name.split())
-    
-    text = re.sub(r'Tab\s+([A-Z\s]+?)\s+(\d+)', capitalize_medicine, text)
-    
-    # Convert SYP. to Syrup
-    text = re.sub(r'\bSYP\.\s+', 'Syrup ', text)
-    
-    # Convert GEL to Gel
-    text = re.sub(r'\bGEL\s+', 'Gel ', text)
-    
-    return text
+    compiled = _compiled_rules.get(language) or _compile_rules(language)
+    pattern, tables = compiled
+    abbreviations = tables["abbreviations"]
+    units = tables["units"]
+    words = tables["words"]
+
+    def replace(match):
+        kind = match.lastgroup
+        if kind == "caps":
+            return match.group(kind).capitalize()
+        if kind == "abbr":
+            return abbreviations[match.group(kind)]
+        if kind == "unit":
+            return " " + units[match.group(kind)]
+        return words[match.group(kind)]
+
+    return pattern.sub(replace, text)
 
 
 def generate_voice_output(text, language, output_filename=None):
@@ -65,7 +122,7 @@ def generate_voice_output(text, language, output_filename=None):
     language_code = LANGUAGE_CODE_MAP[language]
     
     # Preprocess text for better TTS output
-    processed_text = preprocess_text_for_tts(text)
+    processed_text = preprocess_text_for_tts(text, language)
     
     # Generate default filename if not provided
     if output_filename is None:
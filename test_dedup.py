@@ -0,0 +1,33 @@
+import random
+from modules.dedup import BKTree, hamming_distance
+
+
+def test_hamming_distance():
+    assert hamming_distance(0b1011, 0b0001) == 2
+    assert hamming_distance(2**64 - 1, 0) == 64
+
+
+def test_bk_tree_matches_brute_force():
+    rng = random.Random(7)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+    assert len(tree) == len(values)
+
+    for _ in range(50):
+        # Queries near stored hashes, so every distance bucket gets hits
+        query = rng.choice(values) ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+        for max_distance in (0, 2, 4, 10):
+            expected = sorted(
+                (hamming_distance(query, value), i)
+                for i, value in enumerate(values)
+                if hamming_distance(query, value) <= max_distance
+            )
+            found = tree.search(query, max_distance)
+            assert sorted(found) == expected
+            assert [d for d, _ in found] == sorted(d for d, _ in found)
+
+
+def test_empty_tree():
+    assert BKTree().search(123, 10) == []
@@ -0,0 +1,32 @@
+import pytest
+from modules.lexicon import normalize_medicine_name, split_medicine_name
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("TAB. SOMPRAZ 40MG", ("Tablet", "SOMPRAZ", "40 mg")),
+    ("SYP. DOLCID SYP", ("Syrup", "DOLCID", None)),
+    ("TAB. D-RISE 60K", ("Tablet", "D-RISE", "60K")),
+    ("TAB. TELMA 40", ("Tablet", "TELMA", "40")),
+    ("TAB. UPRISE D3", ("Tablet", "UPRISE D3", None)),
+    ("AUGMENTIN 625", (None, "AUGMENTIN", "625")),
+])
+def test_split_medicine_name(raw, expected):
+    assert split_medicine_name(raw) == expected
+
+
+@pytest.mark.parametrize("raw, canonical", [
+    ("TAB. TELMA 40", "TELMA"),
+    ("TAB. PAN 40", "PAN"),
+    ("TAB. PAN D", "PAN D"),
+    ("TAB. SOMPRAZ 40MG", "SOMPRAZ"),
+])
+def test_lexicon_finds_brand_families(raw, canonical):
+    norm = normalize_medicine_name(raw)
+    assert norm["canonical_name"] == canonical
+    assert norm["match_score"] == 1.0
+
+
+def test_fuzzy_match_is_scored_below_exact():
+    norm = normalize_medicine_name("TAB. TELMAA 40")
+    assert norm["canonical_name"] == "TELMA"
+    assert 0.5 <= norm["match_score"] < 1.0
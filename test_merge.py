@@ -0,0 +1,72 @@
+from modules.extractor import merge_page_results
+
+
+def _medicine(name, **fields):
+    med = {
+        "medicine_name": name,
+        "dosage_pattern": "1-0-1",
+        "frequency": "every day",
+        "duration": "5 days",
+        "food_instruction": "after food",
+        "special_notes": "unclear",
+        "confidence_note": "High"
+    }
+    med.update(fields)
+    return med
+
+
+def _page(*medicines, summary=""):
+    return {"structured_data": list(medicines), "patient_summary": summary}
+
+
+def test_same_medicine_on_two_pages_is_merged():
+    merged = merge_page_results([
+        _page(_medicine("TAB. SOMPRAZ 40MG", duration="unclear")),
+        _page(_medicine("TAB. SOMPRAZ 40MG"))
+    ])
+
+    assert len(merged["structured_data"]) == 1
+    assert merged["structured_data"][0]["duration"] == "5 days"
+
+
+def test_unclear_names_are_never_merged():
+    merged = merge_page_results([
+        _page(_medicine("unclear", dosage_pattern="1-0-0")),
+        _page(_medicine("unclear", dosage_pattern="0-0-1"))
+    ])
+    assert len(merged["structured_data"]) == 2
+
+
+def test_conflicting_dosage_keeps_both():
+    merged = merge_page_results([
+        _page(_medicine("TAB. DOLO 650", dosage_pattern="1-0-1")),
+        _page(_medicine("TAB. DOLO 650", dosage_pattern="1-1-1"))
+    ])
+    assert len(merged["structured_data"]) == 2
+
+
+def test_filled_field_keeps_lower_confidence():
+    merged = merge_page_results([
+        _page(_medicine("TAB. PAN 40", duration="unclear", confidence_note="High")),
+        _page(_medicine("TAB. PAN 40", confidence_note="Low"))
+    ])
+    med = merged["structured_data"][0]
+    assert med["duration"] == "5 days"
+    assert med["confidence_note"] == "Low"
+
+
+def test_summary_line_rebuilt_when_field_filled():
+    merged = merge_page_results([
+        _page(_medicine("TAB. PAN 40", duration="unclear"),
+              summary="1. TAB. PAN 40: Take 1 tablet, every day for unclear."),
+        _page(_medicine("TAB. PAN 40", duration="2 weeks"))
+    ])
+    assert "2 weeks" in merged["patient_summary"]
+    assert "for unclear" not in merged["patient_summary"]
+
+
+def test_truncated_page_marks_merge_truncated():
+    truncated = _page(_medicine("TAB. A"))
+    truncated["truncated"] = True
+    merged = merge_page_results([truncated, _page(_medicine("TAB. B"))])
+    assert merged["truncated"] is True
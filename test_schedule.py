@@ -0,0 +1,40 @@
+import pytest
+from modules.schedule import (
+    DEFAULT_DURATION_DAYS,
+    _prescription_id,
+    _prescription_number,
+    parse_dose_slots,
+    parse_duration_days
+)
+
+
+@pytest.mark.parametrize("pattern, frequency, expected", [
+    ("1-0-1", "", (("morning", "night"), (1.0, 1.0))),
+    ("1-1-1-1", "", (("morning", "afternoon", "evening", "night"), (1.0,) * 4)),
+    ("½-0-1", "", (("morning", "night"), (0.5, 1.0))),
+    ("1½-0-1", "", (("morning", "night"), (1.5, 1.0))),
+    ("1/2-0-1/2", "", (("morning", "night"), (0.5, 0.5))),
+    ("1 1/2-0-0", "", (("morning",), (1.5,))),
+    ("unclear", "BD", (("morning", "night"), (1.0, 1.0))),
+    ("1-0-1", "SOS", ((), ())),
+])
+def test_parse_dose_slots(pattern, frequency, expected):
+    assert parse_dose_slots(pattern, frequency) == expected
+
+
+@pytest.mark.parametrize("duration, days", [
+    ("5 days", 5),
+    ("2 weeks", 14),
+    ("1 month", 30),
+    ("Till Next Visit", DEFAULT_DURATION_DAYS),
+    ("unclear", DEFAULT_DURATION_DAYS),
+])
+def test_parse_duration_days(duration, days):
+    assert parse_duration_days(duration) == days
+
+
+@pytest.mark.parametrize("prescription_id", ["20260227_224637", "20260227_224637_000000", "20260227_224637_123456"])
+def test_prescription_id_round_trip(prescription_id):
+    number = _prescription_number(prescription_id)
+    assert number < 2**63
+    assert _prescription_id(number) == prescription_id
@@ -0,0 +1,71 @@
+import json
+import pytest
+from modules.routing import escalation_reason
+from modules.schema import (
+    MISSING_VALUE,
+    medicine_key,
+    parse_extraction,
+    repair_truncated_json,
+    validate_re_asked_value
+)
+
+
+def _medicine(name, **fields):
+    med = {
+        "medicine_name": name,
+        "dosage_pattern": "1-0-1",
+        "frequency": "every day",
+        "duration": "5 days",
+        "food_instruction": "after food",
+        "special_notes": "unclear",
+        "confidence_note": "High"
+    }
+    med.update(fields)
+    return med
+
+
+def test_parse_extraction_fills_missing_fields():
+    raw = json.dumps({
+        "structured_data": [{"medicine_name": "TAB. SOMPRAZ 40MG", "confidence_note": "high"}],
+        "patient_summary": "1. TAB. SOMPRAZ 40MG: Take 1 tablet."
+    })
+    result, missing = parse_extraction(f"```json\n{raw}\n```")
+
+    med = result["structured_data"][0]
+    assert med["dosage_pattern"] == MISSING_VALUE
+    assert med["confidence_note"] == "High"
+    assert (0, "duration") in missing
+    assert "truncated" not in result
+
+
+def test_parse_extraction_flags_truncated_output():
+    raw = json.dumps({
+        "structured_data": [_medicine("TAB. A"), _medicine("TAB. B"), _medicine("TAB. C")],
+        "patient_summary": "..."
+    })
+    cut = raw[:raw.index('"TAB. C"')]
+    result, _ = parse_extraction(cut)
+
+    assert result["truncated"] is True
+    assert [m["medicine_name"] for m in result["structured_data"]] == ["TAB. A", "TAB. B"]
+    assert escalation_reason(result) == "truncated_output"
+
+
+def test_parse_extraction_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_extraction("no json here")
+
+
+def test_repair_truncated_json_drops_half_written_value():
+    assert repair_truncated_json('{"a": [1, 2], "b": "unfinis') == {"a": [1, 2]}
+
+
+def test_validate_re_asked_value():
+    assert validate_re_asked_value("confidence_note", "medium") == "Medium"
+    assert validate_re_asked_value("confidence_note", "sure") == "Low"
+    assert validate_re_asked_value("duration", ["5", "days"]) == "5, days"
+    assert validate_re_asked_value("duration", None) == ""
+
+
+def test_medicine_key_ignores_punctuation_and_case():
+    assert medicine_key("Tab. Sompraz-40 mg") == medicine_key("TAB SOMPRAZ 40MG")